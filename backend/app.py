@@ -1,5 +1,8 @@
 import os
 import json
+import asyncio
+import logging
+import threading
 import torch
 import joblib
 import pickle
@@ -9,13 +12,48 @@ import pandas as pd
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 
-from mlmodel import GraphSAGEChurn
+from mlmodel import (
+    GraphSAGEChurn,
+    build_new_node_subgraph,
+    fold_input_scaler,
+    fuse_regressor_onednn,
+    collate_subgraphs,
+    quantize_regressor,
+    strip_dropout,
+    to_adj_t,
+)
 
 SAVE_DIR = "../data/graph-save"
 DEVICE = "cpu"
+USE_COMPILE = os.getenv("TORCH_COMPILE", "1") == "1"
+# int8-квантизация головы меняет предсказания, поэтому включается явно (QUANTIZE_HEAD=1)
+# после сверки с FP32 на реальном чекпойнте (tests/test_backend_inference.py)
+QUANTIZE_HEAD = os.getenv("QUANTIZE_HEAD", "0") == "1"
+# Альтернатива квантизации головы: FP32 + oneDNN Graph fusion (ONEDNN_FUSION=1)
+ONEDNN_FUSION = os.getenv("ONEDNN_FUSION", "0") == "1"
+# Прогрев модели и кэшей на старте (в CI можно отключить: WARMUP=0)
+WARMUP = os.getenv("WARMUP", "1") == "1"
+
+# Число uvicorn-воркеров: потоки torch делятся между ними, чтобы не было oversubscription
+NUM_WORKERS = int(os.getenv("NUM_WORKERS", "1"))
+
+# Micro-batching: запросы, пришедшие в пределах окна, считаются одним forward
+BATCH_MAX_SIZE = int(os.getenv("PREDICT_BATCH_SIZE", "32"))
+BATCH_WINDOW_S = float(os.getenv("PREDICT_BATCH_WINDOW_MS", "5")) / 1000
+# Сколько запрос ждёт результата batch worker, прежде чем вернуть 503
+PREDICT_TIMEOUT_S = float(os.getenv("PREDICT_TIMEOUT_S", "30"))
+
+# Буфер признаков батча растёт кусками по столько строк
+X_BUF_CHUNK = 32
+
+torch.set_num_threads(max(1, (os.cpu_count() or 1) // NUM_WORKERS))
+torch.set_grad_enabled(False)
+torch.set_float32_matmul_precision("high")
 
 app = FastAPI(title="Churn GNN API")
 
+logger = logging.getLogger(__name__)
+
 
 # ---------- utils ----------
 
@@ -24,14 +62,58 @@ def load_vectorizer(path):
         return pickle.load(f)
 
 
+def load_node_features(save_dir):
+    """
+    Признаки нод: (values, columns, node_ids).
+
+    CSV парсится только если .npy-кэша нет или он старше CSV;
+    дальше матрица открывается через mmap без разбора и копирования.
+    """
+    csv_path = os.path.join(save_dir, "node_features.csv")
+    npy_path = os.path.join(save_dir, "node_features.npy")
+    meta_path = os.path.join(save_dir, "node_features.json")
+
+    cache_is_fresh = (
+        os.path.exists(npy_path)
+        and os.path.exists(meta_path)
+        and (not os.path.exists(csv_path) or os.path.getmtime(npy_path) >= os.path.getmtime(csv_path))
+    )
+
+    if not cache_is_fresh:
+        df = pd.read_csv(csv_path, index_col="node_id")
+
+        # Пишем через временные файлы: несколько воркеров могут стартовать одновременно
+        with open(npy_path + ".tmp", "wb") as f:
+            np.save(f, df.values.astype(np.float32))
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(
+                {"columns": df.columns.tolist(), "node_ids": df.index.tolist()},
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(meta_path + ".tmp", meta_path)
+        os.replace(npy_path + ".tmp", npy_path)
+
+    # "c" (copy-on-write): массив writable, поэтому torch.from_numpy работает без копии
+    values = np.load(npy_path, mmap_mode="c")
+    if values.dtype != np.float32:
+        # кэш, записанный до перехода на float32
+        values = values.astype(np.float32)
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+
+    return values, meta["columns"], meta["node_ids"]
+
+
 def build_node_text_embedding(screen, feature, action, vectorizer):
+    # Остаётся sparse (CSR 1×V): плотный вектор размером со словарь не нужен
     text = f"{screen} {feature} {action}"
-    return vectorizer.transform([text]).toarray().squeeze().astype(np.float32)
+    return vectorizer.transform([text])
 
 
 # ---------- load artifacts once ----------
 
-checkpoint = torch.load(os.path.join(SAVE_DIR, "gnn_model.pth"), map_location=DEVICE)
+checkpoint = torch.load(os.path.join(SAVE_DIR, "gnn_model.pth"), map_location=DEVICE, mmap=True)
 
 model = GraphSAGEChurn(
     in_channels=checkpoint["config"]["in_channels"],
@@ -42,18 +124,71 @@ model = GraphSAGEChurn(
 
 model.load_state_dict(checkpoint["model_state_dict"])
 model.eval()
+# set_grad_enabled действует только на текущий поток, а forward идёт в threadpool;
+# без requires_grad у параметров граф autograd не строится ни в одном потоке
+model.requires_grad_(False)
+model = strip_dropout(model)
+
+if QUANTIZE_HEAD:
+    model = quantize_regressor(model)
+elif ONEDNN_FUSION:
+    model = fuse_regressor_onednn(model)
 
 scaler_x = joblib.load(os.path.join(SAVE_DIR, "scaler_x.pkl"))
-edge_index_base = torch.load(os.path.join(SAVE_DIR, "edge_index.pt"), map_location=DEVICE)
 
-features_df = pd.read_csv(
-    os.path.join(SAVE_DIR, "node_features.csv"),
-    index_col="node_id",
+# StandardScaler — аффинное преобразование, его можно встроить в веса первого слоя
+# и подавать в модель признаки как есть
+n_features = checkpoint["config"]["in_channels"]
+model = fold_input_scaler(
+    model,
+    mean=scaler_x.mean_ if scaler_x.mean_ is not None else np.zeros(n_features),
+    scale=scaler_x.scale_ if scaler_x.scale_ is not None else np.ones(n_features),
 )
+# int32 вдвое уменьшает объём индексов, которые читаются при выборе подграфа и в SpMM
+edge_index_base = torch.load(
+    os.path.join(SAVE_DIR, "edge_index.pt"),
+    map_location=DEVICE,
+    mmap=True,
+).to(torch.int32).contiguous()
+
+base_values, feature_columns, node_ids = load_node_features(SAVE_DIR)
 
 vectorizer = load_vectorizer(os.path.join(SAVE_DIR, "tfidf_vectorizer.pkl"))
 
-mean_churn_rate = features_df["churn_rate"].mean()
+_column_index = {name: i for i, name in enumerate(feature_columns)}
+_node_id_to_idx = {node_id: i for i, node_id in enumerate(node_ids)}
+
+# nanmean — как pandas .mean(), который пропускает NaN; накопление в float64
+mean_churn_rate = float(np.nanmean(base_values[:, _column_index["churn_rate"]], dtype=np.float64))
+
+# Масштабирование встроено в модель: базовые ноды идут в неё без transform
+x_base_tensor = torch.from_numpy(base_values).to(DEVICE)
+
+# Всё, что нужно для сборки новой ноды, готовится один раз: в запросе только NumPy
+_feature_mean = np.nanmean(base_values, axis=0, dtype=np.float64).astype(np.float32)
+
+# Позиции колонок text_emb_{i} для каждого слова словаря (-1 — колонки нет)
+_text_emb_positions = np.array([
+    _column_index.get(f"text_emb_{i}", -1)
+    for i in range(len(vectorizer.vocabulary_))
+])
+
+# Шаблон новой ноды: средние признаки с обнулённым эмбеддингом,
+# при сборке достаточно записать только ненулевые TF-IDF веса
+_new_row_template = _feature_mean.copy()
+_new_row_template[_text_emb_positions[_text_emb_positions >= 0]] = 0.0
+
+NUM_HOPS = len(model.convs)
+
+# Модель обёрнута torch.compile; сбрасывается, если прогрев не построил ни одного графа
+_model_compiled = USE_COMPILE
+
+if USE_COMPILE:
+    # Размер подграфа зависит от окрестности ноды, поэтому dynamic=True;
+    # сама компиляция происходит при прогреве на старте приложения.
+    # Dynamo не трассирует sparse CSR входы, поэтому скомпилированная модель
+    # получает edge_index (см. _graph_input)
+    model = torch.compile(model, mode="reduce-overhead", dynamic=True)
 
 
 # ---------- api schema ----------
@@ -70,19 +205,37 @@ class PredictResponse(BaseModel):
     churn_vs_mean_percent: float
 
 
-# ---------- endpoint ----------
+# ---------- inference ----------
 
-@app.post("/api/predict", response_model=PredictResponse)
-def predict(req: PredictRequest):
-    num_old_nodes = features_df.shape[0]
+# Один forward за раз: модель и её скомпилированный граф общие для всех потоков
+_model_lock = threading.Lock()
+
+# Переиспользуемый буфер признаков батча. Батчи считаются строго по очереди
+# (один batch worker), поэтому гонок за буфер нет
+_x_buf = torch.zeros((X_BUF_CHUNK, x_base_tensor.size(1)), dtype=x_base_tensor.dtype, device=DEVICE)
 
+
+def _get_x_buffer(num_rows):
+    global _x_buf
+    if _x_buf.size(0) < num_rows:
+        capacity = -(-num_rows // X_BUF_CHUNK) * X_BUF_CHUNK
+        _x_buf = torch.zeros((capacity, _x_buf.size(1)), dtype=_x_buf.dtype, device=DEVICE)
+    return _x_buf
+
+
+def _prepare_subgraph(req: PredictRequest):
     # if not (0 <= req.existing_node_idx < num_old_nodes):
     #     raise HTTPException(
     #         status_code=400,
     #         detail=f"existing_node_idx must be in [0, {num_old_nodes - 1}]",
     #     )
     
-    existing_node_idx = features_df.index.get_loc(req.node_id)
+    existing_node_idx = _node_id_to_idx.get(req.node_id)
+    if existing_node_idx is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"node_id {req.node_id} not found",
+        )
 
     # existing_node_idx = features_df[features_df['node_id'] == req.node_id].index
 
@@ -94,46 +247,184 @@ def predict(req: PredictRequest):
         vectorizer,
     )
 
-    new_node = features_df.mean().copy()
+    new_row = _new_row_template.copy()
 
-    for i, v in enumerate(text_emb):
-        col = f"text_emb_{i}"
-        if col in new_node:
-            new_node[col] = v
+    positions = _text_emb_positions[text_emb.indices]
+    known = positions >= 0
+    new_row[positions[known]] = text_emb.data[known]
 
-    new_node_df = pd.DataFrame(
-        [new_node],
-        columns=features_df.columns,
+    # ---- subgraph around the new node ----
+    return build_new_node_subgraph(
+        x_base_tensor,
+        edge_index_base,
+        existing_node_idx,
+        torch.from_numpy(new_row[None, :]).to(DEVICE),
+        num_hops=NUM_HOPS,
     )
 
-    # ---- stack features ----
-    X_all = np.vstack([
-        features_df.values,
-        new_node_df.values,
-    ])
 
-    X_all_scaled = scaler_x.transform(X_all)
-    x_tensor = torch.tensor(X_all_scaled, dtype=torch.float, device=DEVICE)
+def _graph_input(edge_index, num_nodes, dtype):
+    """
+    Вход графа для forward.
+
+    Без компиляции соседи агрегируются через SpMM по CSR, а не scatter по списку рёбер.
+    Под torch.compile sparse-тензор заставил бы dynamo пропустить forward и все SAGEConv,
+    поэтому скомпилированная модель получает edge_index (int64 — как требует scatter).
+
+    При настройках по умолчанию (TORCH_COMPILE=1) CSR-путь не используется: он включается
+    через TORCH_COMPILE=0 или если компиляция не удалась при прогреве. Сравнения скорости
+    CSR SpMM со скомпилированным scatter пока нет.
+    """
+    if _model_compiled:
+        return edge_index.long()
+    return to_adj_t(edge_index, num_nodes, dtype=dtype)
+
+
+def _predict_churn_rates(reqs):
+    """
+    Предсказание для пачки запросов одним forward.
 
-    # ---- add edge ----
-    new_node_idx = num_old_nodes
+    Ошибка подготовки одного запроса не валит остальные: на его месте
+    в результате будет исключение.
+    """
+    results = [None] * len(reqs)
+    subgraphs, positions = [], []
 
-    new_edges = torch.tensor(
-        [
-            [existing_node_idx, new_node_idx],
-            [new_node_idx, existing_node_idx],
-        ],
-        dtype=torch.long,
-        device=DEVICE,
-    ).t()
+    for i, req in enumerate(reqs):
+        try:
+            subgraphs.append(_prepare_subgraph(req))
+            positions.append(i)
+        except Exception as e:
+            results[i] = e
 
-    edge_index = torch.cat([edge_index_base, new_edges], dim=1)
+    if not subgraphs:
+        return results
+
+    num_rows = sum(x_sub.size(0) for x_sub, _, _ in subgraphs)
+    x, edge_index, new_node_idx = collate_subgraphs(subgraphs, x_out=_get_x_buffer(num_rows))
+
+    graph_input = _graph_input(edge_index, x.size(0), x.dtype)
 
     # ---- predict ----
-    with torch.no_grad():
-        out = model(x_tensor, edge_index)
+    with _model_lock:
+        out = model(x, graph_input)
+
+    for i, churn_rate in zip(positions, out[new_node_idx].tolist()):
+        results[i] = float(churn_rate)
+
+    return results
+
+
+# ---------- batching ----------
+
+_predict_queue = None
+_batch_worker_task = None
+
+
+async def _batch_worker():
+    loop = asyncio.get_running_loop()
+
+    while True:
+        batch = [await _predict_queue.get()]
+        deadline = loop.time() + BATCH_WINDOW_S
+
+        while len(batch) < BATCH_MAX_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(_predict_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        reqs = [req for req, _ in batch]
+        try:
+            results = await loop.run_in_executor(None, _predict_churn_rates, reqs)
+        except Exception as e:
+            results = [e] * len(batch)
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+@app.on_event("startup")
+def _warmup():
+    if not WARMUP:
+        return
 
-    churn_rate = float(out[new_node_idx].item())
+    # Первый прогон — компиляция и primitive cache oneDNN, второй — уже прогретые пулы и кэши
+    warmup_req = PredictRequest(node_id=node_ids[0], screen="", feature="", action="")
+    for _ in range(2):
+        _predict_churn_rates([warmup_req])
+
+    if _model_compiled:
+        from torch._dynamo.utils import counters
+
+        # Если dynamo пропустил forward целиком, компиляция не ускоряет инференс:
+        # дальше работаем на исходной модели, сервис при этом стартует
+        if counters["stats"]["unique_graphs"] == 0:
+            logger.warning(
+                "torch.compile не построил ни одного графа при прогреве, "
+                "используется модель без компиляции (TORCH_COMPILE=0 отключает компиляцию)"
+            )
+            _disable_compiled_model()
+            _predict_churn_rates([warmup_req])
+
+
+def _disable_compiled_model():
+    global model, _model_compiled
+    with _model_lock:
+        model = model._orig_mod
+        _model_compiled = False
+
+
+def _run_batch_worker():
+    global _batch_worker_task
+    _batch_worker_task = asyncio.create_task(_batch_worker())
+    _batch_worker_task.add_done_callback(_on_batch_worker_done)
+
+
+def _on_batch_worker_done(task):
+    # Воркер крутится бесконечно: завершение без отмены — это падение, его перезапускаем
+    if task.cancelled():
+        return
+    logger.error("batch worker упал, перезапуск", exc_info=task.exception())
+    _run_batch_worker()
+
+
+@app.on_event("startup")
+async def _start_batch_worker():
+    global _predict_queue
+    _predict_queue = asyncio.Queue()
+    _run_batch_worker()
+
+
+# ---------- endpoint ----------
+
+@app.post("/api/predict", response_model=PredictResponse)
+async def predict(req: PredictRequest):
+    # Без startup-хука (например, TestClient вне with) очереди и воркера нет — не ждём вечно
+    if _predict_queue is None or _batch_worker_task is None or _batch_worker_task.done():
+        raise HTTPException(
+            status_code=503,
+            detail="batch worker is not running",
+        )
+
+    # Запрос уходит в очередь, forward делает фоновый batch worker
+    future = asyncio.get_running_loop().create_future()
+    await _predict_queue.put((req, future))
+    try:
+        churn_rate = await asyncio.wait_for(future, PREDICT_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=503,
+            detail=f"prediction timed out after {PREDICT_TIMEOUT_S:g}s",
+        )
 
     churn_vs_mean_percent = (
         (churn_rate / mean_churn_rate) * 100
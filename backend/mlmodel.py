@@ -2,6 +2,7 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from torch_geometric.nn import SAGEConv
+from torch_geometric.utils import k_hop_subgraph
 
 class GraphSAGEChurn(nn.Module):
     """
@@ -34,7 +35,176 @@ class GraphSAGEChurn(nn.Module):
             x = conv(x, edge_index)
             if i < len(self.convs) - 1:
                 x = F.relu(x)
-                x = F.dropout(x, p=self.dropout, training=self.training)
+                if self.training:
+                    x = F.dropout(x, p=self.dropout, training=True)
 
         out = self.regressor(x)
         return out.squeeze(-1)   # [num_nodes]
+
+
+def strip_dropout(model):
+    """
+    Замена nn.Dropout на nn.Identity для инференса: в eval-режиме они
+    ничего не делают, но всё равно проходят через dispatcher.
+    """
+    for module in list(model.modules()):
+        for name, child in module.named_children():
+            if isinstance(child, nn.Dropout):
+                setattr(module, name, nn.Identity())
+    return model
+
+
+def quantize_regressor(model):
+    """
+    Dynamic int8-квантизация Linear-слоёв MLP-головы для инференса на CPU.
+    SAGEConv остаются в FP32: агрегация соседей плохо переносит квантизацию.
+    """
+    model.regressor = torch.ao.quantization.quantize_dynamic(
+        model.regressor,
+        {nn.Linear},
+        dtype=torch.qint8,
+    )
+    return model
+
+
+def fuse_regressor_onednn(model, example_rows=8):
+    """
+    Трассировка MLP-головы с oneDNN Graph fusion для CPU: пары Linear + ReLU
+    сливаются в один примитив без промежуточных тензоров.
+
+    Только для FP32-головы (не после quantize_regressor). optimize_for_inference
+    не вызывается — он конфликтует с oneDNN Graph.
+    """
+    torch.jit.enable_onednn_fusion(True)
+
+    example = torch.rand(example_rows, model.regressor[0].in_features)
+
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(model.regressor, example))
+        # fusion срабатывает после профилирующих прогонов
+        traced(example)
+        traced(example)
+
+    model.regressor = traced
+    return model
+
+
+def fold_input_scaler(model, mean, scale):
+    """
+    Встраивание StandardScaler в первый SAGEConv: модель принимает признаки без масштабирования.
+
+    Для x' = (x - mean) / scale линейный слой W @ x' + b равен
+    (W / scale) @ x + b - (W / scale) @ mean. Для lin_l (агрегация соседей)
+    это точно, если у ноды есть хотя бы один входящий сосед: mean по пустому
+    множеству даёт 0, а не -mean / scale.
+    """
+    conv = model.convs[0]
+    mean = torch.as_tensor(mean, dtype=conv.lin_l.weight.dtype)
+    inv_scale = 1.0 / torch.as_tensor(scale, dtype=conv.lin_l.weight.dtype)
+
+    lins = [conv.lin_l, conv.lin_r] if conv.root_weight else [conv.lin_l]
+
+    with torch.no_grad():
+        shift = torch.zeros_like(conv.lin_l.bias)
+        for lin in lins:
+            lin.weight.mul_(inv_scale)
+            shift += lin.weight @ mean
+        conv.lin_l.bias.sub_(shift)
+
+    return model
+
+
+def build_new_node_subgraph(x_base, edge_index_base, existing_node_idx, x_new, num_hops):
+    """
+    Подграф для инференса новой ноды, присоединённой к existing_node_idx.
+
+    Выход GNN из num_hops слоёв для новой ноды зависит только от
+    num_hops-окрестности точки присоединения, поэтому весь граф
+    прогонять не нужно.
+
+    Returns:
+        x_sub, edge_index_sub, new_local_idx
+    """
+    subset, edge_index_sub, mapping, _ = k_hop_subgraph(
+        existing_node_idx,
+        num_hops,
+        edge_index_base,
+        relabel_nodes=True,
+        num_nodes=x_base.size(0),
+    )
+
+    existing_local_idx = int(mapping[0])
+    new_local_idx = subset.numel()
+
+    # Рёбра подграфа и два ребра к новой ноде пишутся в один буфер, без cat
+    num_sub_edges = edge_index_sub.size(1)
+    edge_buf = edge_index_sub.new_empty((2, num_sub_edges + 2))
+    edge_buf[:, :num_sub_edges] = edge_index_sub
+    edge_buf[0, num_sub_edges] = existing_local_idx
+    edge_buf[1, num_sub_edges] = new_local_idx
+    edge_buf[0, num_sub_edges + 1] = new_local_idx
+    edge_buf[1, num_sub_edges + 1] = existing_local_idx
+
+    x_sub = x_base.new_empty((new_local_idx + x_new.size(0), x_base.size(1)))
+    torch.index_select(x_base, 0, subset, out=x_sub[:new_local_idx])
+    x_sub[new_local_idx:] = x_new
+
+    return x_sub, edge_buf, new_local_idx
+
+
+def collate_subgraphs(subgraphs, x_out=None):
+    """
+    Объединение нескольких подграфов в один несвязный граф для одного forward.
+
+    Подграфы не пересекаются, поэтому новые ноды разных запросов
+    не влияют друг на друга даже при общей точке присоединения.
+
+    Args:
+        subgraphs: список (x_sub, edge_index_sub, new_local_idx)
+        x_out: необязательный буфер [capacity, F]; если его хватает,
+               признаки пишутся в него без новой аллокации
+
+    Returns:
+        x, edge_index, new_node_idx (позиции новых нод в объединённом графе)
+    """
+    num_nodes = sum(x_sub.size(0) for x_sub, _, _ in subgraphs)
+
+    if x_out is not None and x_out.size(0) >= num_nodes:
+        x = x_out[:num_nodes]
+    else:
+        x = subgraphs[0][0].new_empty((num_nodes, subgraphs[0][0].size(1)))
+
+    edge_indices, new_node_idx = [], []
+    offset = 0
+
+    for x_sub, edge_index_sub, new_local_idx in subgraphs:
+        x[offset:offset + x_sub.size(0)] = x_sub
+        edge_indices.append(edge_index_sub + offset)
+        new_node_idx.append(offset + new_local_idx)
+        offset += x_sub.size(0)
+
+    return (
+        x,
+        torch.cat(edge_indices, dim=1),
+        torch.tensor(new_node_idx, dtype=torch.long),
+    )
+
+
+def to_adj_t(edge_index, num_nodes, dtype=torch.float):
+    """
+    CSR-матрица смежности adj_t[target, source] для SAGEConv.
+
+    С ней SAGEConv агрегирует соседей одним SpMM вместо gather + scatter_add
+    по списку рёбер. Повторные рёбра не схлопываются, чтобы mean-агрегация
+    совпадала с результатом по edge_index.
+    """
+    row, perm = torch.sort(edge_index[1], stable=True)
+    col = edge_index[0, perm]
+
+    # crow в том же dtype, что и col: CSR принимает и int32, и int64 индексы
+    crow = torch.zeros(num_nodes + 1, dtype=edge_index.dtype, device=edge_index.device)
+    crow[1:] = torch.cumsum(torch.bincount(row, minlength=num_nodes), dim=0)
+
+    values = torch.ones(col.numel(), dtype=dtype, device=edge_index.device)
+
+    return torch.sparse_csr_tensor(crow, col, values, size=(num_nodes, num_nodes))
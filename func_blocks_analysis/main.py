@@ -65,7 +65,9 @@ def main():
         print("=" * 80)
 
         preprocessor = DataPreprocessor(config_path="config.yaml")
-        processed_file = Path('data/processed/merged_data.csv')
+        processed_file = Path('data/processed/merged_data.parquet')
+        if not processed_file.exists():
+            processed_file = Path('data/processed/merged_data.csv')
 
         if processed_file.exists():
             # Загрузка существующего обработанного датасета
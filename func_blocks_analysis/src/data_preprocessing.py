@@ -4,20 +4,271 @@
 
 import pandas as pd
 import numpy as np
+import hashlib
 import json
 import logging
+import os
+import weakref
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
 import yaml
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
 
 logger = logging.getLogger(__name__)
 
+# Колонки, по которым сравниваются события (дедупликация, уникальные значения и комбинации).
+# Загрузчики приводят их к category, поэтому ключи строятся по .cat.codes без строк
+COMPARISON_COLS = ('Экран', 'Функционал', 'Действие')
+
+# Polars опционален: если установлен, CSV событий читается многопоточно
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+# ciso8601 опционален: C-парсер ISO8601 для pandas-пути загрузки
+try:
+    import ciso8601
+except ImportError:
+    ciso8601 = None
+
+# orjson опционален: быстрая запись больших JSON-отчётов
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Numba опционален: JIT-ядро для схлопывания "Не указано" в collapse_intermediate_screens
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def _parse_iso_datetime(value):
+    """
+    Парсинг одной даты вида 2025-09-29T10:20:27+03:00[Europe/Moscow] через ciso8601
+
+    Returns:
+        datetime или None, если значение пустое или не распарсилось
+    """
+    if not isinstance(value, str):
+        return None
+    bracket = value.find('[')
+    if bracket >= 0:
+        value = value[:bracket]
+    try:
+        return ciso8601.parse_datetime(value)
+    except ValueError:
+        return None
+
+
+def _write_json(path, data) -> None:
+    """
+    Запись JSON с отступом 2 и UTF-8 без экранирования; через orjson, если он установлен
+    """
+    if orjson is not None:
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def _equals_value(series: pd.Series, value) -> np.ndarray:
+    """
+    Маска series == value; для category сравниваются коды с кодом значения, без строк
+
+    Returns:
+        numpy bool-массив (NaN не равен ничему)
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = series.cat.categories
+        if value not in categories:
+            return np.zeros(len(series), dtype=bool)
+        return series.cat.codes.to_numpy() == categories.get_loc(value)
+    return series.eq(value).to_numpy()
+
+
+def _shift_in_session(values: np.ndarray, session_ids: np.ndarray, periods: int, fill) -> np.ndarray:
+    """
+    Сдвиг значений на одну запись в пределах сессии для данных, отсортированных по сессии
+    (аналог groupby('global_session_id').shift(periods) без группировки)
+
+    Args:
+        values: значения колонки
+        session_ids: ID сессий той же длины
+        periods: 1 - предыдущее значение, -1 - последующее
+        fill: значение на границе сессии
+
+    Returns:
+        Массив того же типа, что и values
+    """
+    if periods not in (1, -1):
+        raise ValueError(f"Поддерживается только сдвиг на 1 или -1, получено {periods}")
+
+    out = np.empty_like(values)
+    boundary = np.ones(len(session_ids), dtype=bool)
+    if periods == 1:
+        out[1:] = values[:-1]
+        boundary[1:] = session_ids[1:] != session_ids[:-1]
+    else:
+        out[:-1] = values[1:]
+        boundary[:-1] = session_ids[1:] != session_ids[:-1]
+    out[boundary] = fill
+    return out
+
+
+def _collapse_vectorized(group_id, is_ns, duration, keep):
+    """
+    Векторный вариант _collapse_kernel (без numba) с тем же контрактом: если в группе экрана есть
+    и записи "Не указано", и значимые, длительность записей "Не указано" прибавляется к первой
+    значимой записи группы, а сами они помечаются на удаление
+
+    Args:
+        group_id: ID группы экрана
+        is_ns: маска записей с Действие="Не указано"
+        duration: duration_seconds, изменяется на месте
+        keep: выходная маска сохраняемых записей
+    """
+    is_meaningful = ~is_ns
+    not_specified_duration = (
+        pd.Series(np.where(is_ns, duration, 0)).groupby(group_id, sort=False).transform('sum').to_numpy()
+    )
+    meaningful_gb = pd.Series(is_meaningful).groupby(group_id, sort=False)
+    has_meaningful = meaningful_gb.transform('any').to_numpy()
+
+    # Первая значимая запись группы получает накопленную длительность (0, если "Не указано" нет)
+    first_meaningful = is_meaningful & (meaningful_gb.cumsum().to_numpy() == 1)
+    duration[first_meaningful] += not_specified_duration[first_meaningful]
+
+    # Записи с "Не указано" удаляются только если в группе есть значимая запись
+    keep[:] = ~(is_ns & has_meaningful)
+
+
+if njit is not None:
+    # Без cache=True: дисковый кэш numba привязан к имени модуля, под которым ядро скомпилировано,
+    # и ломается при импорте того же файла под другим именем (src.data_preprocessing / data_preprocessing)
+    @njit
+    def _collapse_kernel(group_id, is_ns, duration, keep):
+        """
+        Один проход по группам экрана (данные отсортированы, группа - непрерывный отрезок):
+        длительность записей "Не указано" прибавляется к первой значимой записи группы,
+        а сами записи "Не указано" помечаются на удаление. Группы без значимых записей не меняются
+
+        Args:
+            group_id: ID группы экрана
+            is_ns: маска записей с Действие="Не указано"
+            duration: duration_seconds, изменяется на месте
+            keep: выходная маска сохраняемых записей
+        """
+        n = len(group_id)
+        i = 0
+        while i < n:
+            j = i
+            ns_sum = 0
+            first_meaningful = -1
+            while j < n and group_id[j] == group_id[i]:
+                if is_ns[j]:
+                    ns_sum += duration[j]
+                    keep[j] = False
+                else:
+                    if first_meaningful < 0:
+                        first_meaningful = j
+                    keep[j] = True
+                j += 1
+            if first_meaningful >= 0:
+                duration[first_meaningful] += ns_sum
+            else:
+                for k in range(i, j):
+                    keep[k] = True
+            i = j
+else:
+    _collapse_kernel = None
+
 
 class DataPreprocessor:
     """
     Класс для загрузки, очистки и предобработки данных
     """
+
+    # Типы колонок events.csv (БЕЗ типа для даты - она парсится отдельно)
+    EVENTS_DTYPES = {
+        'Экран': 'category',
+        'Функционал': 'category',
+        'Действие': 'category',
+        'Идентификатор устройства': 'int32',
+        'Номер сессии в рамках устройства': 'int64',
+        'Производитель устройства': 'category',
+        'Модель устройства': 'category',
+        'Тип устройства': 'category',
+        # Известный набор значений - парсер сразу пишет коды категорий
+        'ОС': pd.CategoricalDtype(['Android', 'iOS'])
+    }
+
+    # Categorical колонки merged_df
+    MERGED_CATEGORICAL_COLS = [
+        'Экран', 'Функционал', 'Действие',
+        'Производитель устройства', 'Модель устройства',
+        'Тип устройства', 'ОС', 'time_of_day',
+        'gender', 'age_group'
+    ]
+
+    # Integer колонки merged_df с оптимизацией памяти
+    MERGED_INT_COLS = {
+        # Основные колонки
+        'Идентификатор устройства': 'int32',
+        'Номер сессии в рамках устройства': 'int64',
+        'hour': 'int8',
+        'day_of_week': 'int8',
+        'month': 'int8',
+        'day': 'int8',
+        'number': 'int32',
+        'global_session_id': 'int32',  # Глобальный ID сессии (до ~1M)
+        'duration_seconds': 'int32',  # Длительность события (секунды)
+        'click_count': 'int16',  # Количество кликов (1-100)
+        'dbl_duration_seconds': 'int32',  # Длительность удалённых дублей
+        'dbl_count': 'int16'  # Количество удалённых дублей
+    }
+
+    # Префиксы всех 17 функциональных блоков (колонки FunnelFeaturesExtractor)
+    FUNNEL_PREFIXES = [
+        'request',  # Создание заявки
+        'req_manage',  # Просмотр и управление заявками
+        'profile',  # Профиль
+        'nav',  # Навигация
+        'notif',  # Уведомления
+        'poll_oss',  # Опросы и собрания собственников
+        'rewards',  # Баллы и поощрения
+        'my_home',  # Мой дом
+        'partners',  # Услуги партнеров
+        'transport',  # Управление транспортом
+        'ann_view',  # Просмотр объявлений
+        'smart',  # Умные решения
+        'support',  # Техподдержка
+        'guest',  # Гостевой доступ
+        'city_serv',  # Городские сервисы
+        'address',  # Создание адреса
+        'ann_create'  # Создание объявления
+    ]
+
+    # Порядок строк, который требуют шаги pipeline по сессиям
+    SESSION_SORT_KEYS = ('global_session_id', 'Дата и время события')
+
+    # Ключ метаданных Feather-кэша с размером и временем изменения исходного CSV и версией схемы типов
+    FEATHER_CACHE_KEY = b'source_csv_stat'
+    # Версия логики типизации при загрузке: увеличить при изменении преобразований в загрузчике,
+    # чтобы старые кэши перестали считаться актуальными
+    FEATHER_CACHE_VERSION = 1
+
+    # Fallback на более широкий тип, если значения не помещаются
+    WIDER_INT_DTYPE = {'int8': 'int16', 'int16': 'int32', 'int32': 'int64', 'int64': 'int64'}
     
     def __init__(self, config_path: str = "config.yaml"):
         """
@@ -33,6 +284,11 @@ class DataPreprocessor:
         self.users_df: Optional[pd.DataFrame] = None
         self.merged_df: Optional[pd.DataFrame] = None
         self.stats = {}
+
+        # Слабая ссылка на merged_df, про который известно, что он отсортирован по SESSION_SORT_KEYS;
+        # любая замена merged_df (загрузка, новый шаг) сбрасывает это знание. Ссылка слабая,
+        # чтобы замененный фрейм освобождался сразу, а не жил до следующего шага pipeline
+        self._session_sorted_ref: Optional[weakref.ref] = None
         
         logger.info("DataPreprocessor инициализирован")
 
@@ -51,80 +307,208 @@ class DataPreprocessor:
         users_file = Path(raw_path) / self.config['data']['users_file']
 
         # Типы данных для оптимизации памяти (БЕЗ типов для даты!)
-        dtype_events = {
-            'Экран': 'category',
-            'Функционал': 'category',
-            'Действие': 'category',
-            'Идентификатор устройства': 'int32',
-            'Номер сессии в рамках устройства': 'int64',
-            'Производитель устройства': 'category',
-            'Модель устройства': 'category',
-            'Тип устройства': 'category',
-            'ОС': 'category'
-        }
+        dtype_events = self.EVENTS_DTYPES
+
+        # События и пользователи - независимые файлы, читаем параллельно
+        # (CSV-парсеры pyarrow/polars отпускают GIL)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            events_future = executor.submit(self._read_events, events_file, dtype_events)
+            users_future = executor.submit(self._read_users, users_file)
+
+            try:
+                self.events_df = events_future.result()
+            except FileNotFoundError:
+                logger.error(f"Файл не найден: {events_file}")
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка загрузки событий: {e}")
+                raise
+
+            try:
+                self.users_df = users_future.result()
+            except FileNotFoundError:
+                logger.error(f"Файл не найден: {users_file}")
+                raise
+
+        # Значения вне известного набора категорий превращаются в NaN
+        for col, dtype in dtype_events.items():
+            if isinstance(dtype, pd.CategoricalDtype):
+                unknown = self.events_df[col].isna().sum()
+                if unknown > 0:
+                    logger.warning(
+                        f"{col}: {unknown} пустых значений или значений вне {list(dtype.categories)}"
+                    )
 
-        # Загрузка событий - сначала БЕЗ парсинга даты
-        try:
-            logger.info("Загрузка событий...")
-            self.events_df = pd.read_csv(
-                events_file,
-                dtype=dtype_events
-            )
+        # Проверяем сколько дат не распарсилось
+        null_dates = self.events_df['Дата и время события'].isna().sum()
+        if null_dates > 0:
+            logger.warning(f"Не удалось распарсить {null_dates} дат")
 
-            # Парсинг даты вручную с правильным форматом
-            logger.info("Парсинг даты...")
-            # Формат: 2025-09-29T10:20:27+03:00[Europe/Moscow]
-            # Убираем часовой пояс в скобках, если есть
-            date_col = self.events_df['Дата и время события'].astype(str)
-            # Убираем [Europe/Moscow] если есть
-            date_col = date_col.str.replace(r'\[.*?\]', '', regex=True)
-
-            # Парсим дату
-            self.events_df['Дата и время события'] = pd.to_datetime(
-                date_col,
-                format='ISO8601',
-                utc=True,
-                errors='coerce'
+        logger.info(f"События загружены: {len(self.events_df)} строк")
+        logger.info(f"Пользователи загружены: {len(self.users_df)} строк")
+
+        # Сохранение статистики
+        self.stats['events_loaded'] = len(self.events_df)
+        self.stats['users_loaded'] = len(self.users_df)
+
+        return self.events_df, self.users_df
+
+    @classmethod
+    def _read_events(cls, events_file: Path, dtype_events: Dict) -> pd.DataFrame:
+        """
+        Чтение CSV событий с парсингом даты
+
+        Args:
+            events_file: путь к CSV событий
+            dtype_events: типы колонок в нотации pandas
+
+        Returns:
+            DataFrame событий с датой в UTC
+        """
+        logger.info("Загрузка событий...")
+        if pl is not None:
+            return cls._read_events_polars(events_file, dtype_events)
+
+        logger.warning("polars не установлен, используется pandas.read_csv")
+        # Многопоточный CSV-парсер Arrow; дата остаётся строкой из-за суффикса [Europe/Moscow]
+        events_df = pd.read_csv(
+            events_file,
+            dtype=dtype_events,
+            engine='pyarrow'
+        )
+
+        # Парсинг даты вручную с правильным форматом
+        logger.info("Парсинг даты...")
+        # Формат: 2025-09-29T10:20:27+03:00[Europe/Moscow]
+        if ciso8601 is not None:
+            raw_dates = events_df['Дата и время события'].to_numpy(dtype=object)
+            events_df['Дата и время события'] = pd.to_datetime(
+                [_parse_iso_datetime(value) for value in raw_dates],
+                utc=True
             )
+        else:
+            # Убираем [Europe/Moscow] и парсим нативными ядрами Arrow, без Python-цикла по строкам
+            raw_dates = pa.array(events_df['Дата и время события'], type=pa.string(), from_pandas=True)
+            date_col = pc.replace_substring_regex(raw_dates, pattern=r'\[.*?\]', replacement='')
+            parsed = pc.strptime(date_col, format='%Y-%m-%dT%H:%M:%S%z', unit='ns', error_is_null=True)
+            parsed_dates = pd.Series(parsed.to_pandas(), index=events_df.index)
+
+            # strptime не понимает дробные секунды - такие значения дочищает pandas ISO8601-парсер
+            retry = (pc.is_null(parsed).to_numpy(zero_copy_only=False)
+                     & pc.is_valid(date_col).to_numpy(zero_copy_only=False))
+            if retry.any():
+                parsed_dates[retry] = pd.to_datetime(
+                    date_col.filter(pa.array(retry)).to_pandas(),
+                    format='ISO8601',
+                    utc=True,
+                    errors='coerce'
+                ).array
+
+            events_df['Дата и время события'] = parsed_dates
+
+        return events_df
+
+    @staticmethod
+    def _read_users(users_file: Path) -> pd.DataFrame:
+        """
+        Чтение CSV пользователей (БЕЗ указания типа для age_back из-за возможных NA)
 
-            # Проверяем сколько дат не распарсилось
-            null_dates = self.events_df['Дата и время события'].isna().sum()
-            if null_dates > 0:
-                logger.warning(f"Не удалось распарсить {null_dates} дат")
+        Args:
+            users_file: путь к CSV пользователей
 
-            logger.info(f"События загружены: {len(self.events_df)} строк")
+        Returns:
+            DataFrame пользователей
+        """
+        users_df = pd.read_csv(
+            users_file,
+            dtype={
+                'number': 'int32',
+                'gender': 'category'
+            },
+            engine='pyarrow'
+        )
 
-        except FileNotFoundError:
-            logger.error(f"Файл не найден: {events_file}")
-            raise
-        except Exception as e:
-            logger.error(f"Ошибка загрузки событий: {e}")
-            raise
+        # Преобразуем age_back в int16 с сохранением NA
+        if 'age_back' in users_df.columns:
+            users_df['age_back'] = users_df['age_back'].astype('Int16')
 
-        # Загрузка пользователей (БЕЗ указания типа для age_back из-за возможных NA)
-        try:
-            self.users_df = pd.read_csv(
-                users_file,
-                dtype={
-                    'number': 'int32',
-                    'gender': 'category'
-                }
+        return users_df
+
+    @staticmethod
+    def _polars_events_schema(dtype_events: Dict) -> Tuple[Dict, Dict]:
+        """
+        Перевод типов колонок событий из нотации pandas в Polars
+
+        Returns:
+            Tuple: schema_overrides для чтения CSV и Enum-типы для колонок с известным набором категорий
+        """
+        pl_types = {'category': pl.Categorical, 'int32': pl.Int32, 'int64': pl.Int64}
+
+        # Колонки с известным набором категорий читаем строками и приводим к Enum:
+        # неизвестные значения становятся null, как в pandas
+        enum_cols = {
+            col: pl.Enum(list(dtype.categories))
+            for col, dtype in dtype_events.items()
+            if isinstance(dtype, pd.CategoricalDtype)
+        }
+        schema_overrides = {
+            col: pl.Utf8 if col in enum_cols else pl_types[dtype]
+            for col, dtype in dtype_events.items()
+        }
+        return schema_overrides, enum_cols
+
+    @staticmethod
+    def _polars_parse_date(date_col: str):
+        """
+        Выражение Polars для парсинга даты в UTC
+        Формат: 2025-09-29T10:20:27+03:00[Europe/Moscow] -> убираем зону в скобках
+        """
+        return (
+            pl.col(date_col)
+            .str.replace_all(r'\[.*?\]', '')
+            .str.to_datetime(
+                format='%Y-%m-%dT%H:%M:%S%.f%#z',
+                time_unit='ns',
+                time_zone='UTC',
+                strict=False
             )
+        )
 
-            # Преобразуем age_back в int16 с сохранением NA
-            if 'age_back' in self.users_df.columns:
-                self.users_df['age_back'] = self.users_df['age_back'].astype('Int16')
+    @staticmethod
+    def _read_events_polars(events_file: Path, dtype_events: Dict) -> pd.DataFrame:
+        """
+        Чтение CSV событий через Polars (многопоточный парсер) с конвертацией в pandas
 
-            logger.info(f"Пользователи загружены: {len(self.users_df)} строк")
-        except FileNotFoundError:
-            logger.error(f"Файл не найден: {users_file}")
-            raise
+        Args:
+            events_file: путь к CSV событий
+            dtype_events: типы колонок в нотации pandas
 
-        # Сохранение статистики
-        self.stats['events_loaded'] = len(self.events_df)
-        self.stats['users_loaded'] = len(self.users_df)
+        Returns:
+            DataFrame с теми же типами, что и у pandas-пути
+        """
+        schema_overrides, enum_cols = DataPreprocessor._polars_events_schema(dtype_events)
+        events = pl.read_csv(events_file, schema_overrides=schema_overrides)
 
-        return self.events_df, self.users_df
+        logger.info("Парсинг даты...")
+        events = events.with_columns(
+            DataPreprocessor._polars_parse_date('Дата и время события'),
+            *[pl.col(col).cast(enum, strict=False) for col, enum in enum_cols.items()]
+        )
+
+        events_df = events.to_pandas()
+
+        # Enum конвертируется в упорядоченную категорию, pandas-путь даёт неупорядоченную
+        for col in enum_cols:
+            events_df[col] = events_df[col].cat.as_unordered()
+
+        # Polars хранит категории в порядке появления, pandas - отсортированными
+        for col, dtype in dtype_events.items():
+            if col not in enum_cols and dtype == 'category':
+                events_df[col] = events_df[col].cat.reorder_categories(
+                    sorted(events_df[col].cat.categories)
+                )
+
+        return events_df
 
     def clean_data(self) -> None:
         """
@@ -137,30 +521,30 @@ class DataPreprocessor:
 
         # Удаление дублей из событий
         events_before = len(self.events_df)
-        self.events_df = self.events_df.drop_duplicates().copy()
+        self.events_df = self.events_df.loc[~self.events_df.duplicated()]
         events_removed = events_before - len(self.events_df)
         logger.info(f"Удалено дублей в events: {events_removed}")
         self.stats['events_duplicates_removed'] = events_removed
 
         # Удаление дублей из пользователей
         users_before = len(self.users_df)
-        self.users_df = self.users_df.drop_duplicates().copy()
+        self.users_df = self.users_df.loc[~self.users_df.duplicated()]
         users_removed = users_before - len(self.users_df)
         logger.info(f"Удалено дублей в users: {users_removed}")
         self.stats['users_duplicates_removed'] = users_removed
 
         # Обработка пропущенных значений в categorical колонках
         if 'Действие' in self.events_df.columns:
-            # Конвертируем в object для упрощения работы
-            self.events_df['Действие'] = self.events_df['Действие'].astype('object')
-            self.events_df['Действие'] = self.events_df['Действие'].fillna('Не указано')
-            # Конвертируем обратно в category
-            self.events_df['Действие'] = self.events_df['Действие'].astype('category')
+            # Заполняем пропуски на уровне кодов категорий, без промежуточного object
+            action = self.events_df['Действие']
+            if 'Не указано' not in action.cat.categories:
+                action = action.cat.add_categories(['Не указано'])
+            self.events_df['Действие'] = action.fillna('Не указано')
 
         # Удаление строк с пропущенными критичными полями
         critical_columns = ['Дата и время события', 'Идентификатор устройства']
         initial_count = len(self.events_df)
-        self.events_df = self.events_df.dropna(subset=critical_columns).copy()
+        self.events_df = self.events_df.loc[self.events_df[critical_columns].notna().all(axis=1)]
         removed_count = initial_count - len(self.events_df)
         if removed_count > 0:
             logger.info(f"Удалено строк с пропущенными критичными полями: {removed_count}")
@@ -184,58 +568,51 @@ class DataPreprocessor:
             logger.error("DataFrame пустой после очистки!")
             raise ValueError("DataFrame пустой, невозможно создать признаки")
 
-        # Временные признаки
-        self.events_df['date'] = self.events_df['Дата и время события'].dt.date
-        self.events_df['hour'] = self.events_df['Дата и время события'].dt.hour
-        self.events_df['day_of_week'] = self.events_df['Дата и время события'].dt.dayofweek
-        self.events_df['is_weekend'] = self.events_df['day_of_week'].isin([5, 6])
-        self.events_df['month'] = self.events_df['Дата и время события'].dt.month
-        self.events_df['day'] = self.events_df['Дата и время события'].dt.day
-
-        # Время суток
-        def get_time_of_day(hour):
-            if pd.isna(hour):
-                return 'Неизвестно'
-            if 6 <= hour < 12:
-                return 'Утро'
-            elif 12 <= hour < 18:
-                return 'День'
-            elif 18 <= hour < 24:
-                return 'Вечер'
-            else:
-                return 'Ночь'
-
-        self.events_df['time_of_day'] = self.events_df['hour'].apply(get_time_of_day)
-        self.events_df['time_of_day'] = self.events_df['time_of_day'].astype('category')
+        if self.events_df['Дата и время события'].isna().any():
+            raise ValueError("В данных есть пустые даты. Вызовите clean_data() сначала.")
+
+        # Временные признаки (UTC) - один проход по int64-буферу наносекунд вместо шести .dt-аксессоров
+        ns = self.events_df['Дата и время события'].to_numpy(dtype='datetime64[ns]').view('i8')
+        days = ns // 86_400_000_000_000
+        day_start = days.astype('datetime64[D]')
+        month_start = day_start.astype('datetime64[M]')
+
+        self.events_df['date'] = day_start
+        self.events_df['hour'] = (ns // 3_600_000_000_000 % 24).astype('int8')
+        # 1970-01-01 - четверг (dayofweek = 3); Пн=0 ... Вс=6, выходные - 5 и 6
+        day_of_week = ((days + 3) % 7).astype('int8')
+        self.events_df['day_of_week'] = day_of_week
+        self.events_df['is_weekend'] = day_of_week >= 5
+        self.events_df['month'] = (month_start.astype('int64') % 12 + 1).astype('int8')
+        self.events_df['day'] = ((day_start - month_start).astype('int64') + 1).astype('int8')
+
+        # Время суток: [0, 6) Ночь, [6, 12) Утро, [12, 18) День, [18, 24) Вечер
+        self.events_df['time_of_day'] = pd.cut(
+            self.events_df['hour'],
+            bins=[0, 6, 12, 18, 24],
+            labels=['Ночь', 'Утро', 'День', 'Вечер'],
+            right=False,
+            ordered=False
+        ).cat.add_categories(['Неизвестно']).fillna('Неизвестно')
 
         # Объединение с пользовательскими данными
         logger.info("Объединение с данными пользователей...")
-        self.merged_df = self.events_df.merge(
-            self.users_df,
-            left_on='Идентификатор устройства',
-            right_on='number',
-            how='left'
-        )
+        # Join по индексу users (int32): прямой hash-lookup вместо merge по колонкам.
+        # drop=False сохраняет колонку 'number', как было при merge
+        users_by_number = self.users_df.set_index('number', drop=False)
+        if not users_by_number.index.is_unique:
+            logger.warning("В users есть повторяющиеся number - события по ним будут продублированы")
+        self.merged_df = self.events_df.join(users_by_number, on='Идентификатор устройства', how='left')
+        self.merged_df.index = pd.RangeIndex(len(self.merged_df))
 
         # Возрастные группы
-        def get_age_group(age):
-            if pd.isna(age):
-                return 'Неизвестно'
-            elif age < 25:
-                return '18-24'
-            elif age < 35:
-                return '25-34'
-            elif age < 45:
-                return '35-44'
-            elif age < 55:
-                return '45-54'
-            elif age < 65:
-                return '55-64'
-            else:
-                return '65+'
-
-        self.merged_df['age_group'] = self.merged_df['age_back'].apply(get_age_group)
-        self.merged_df['age_group'] = self.merged_df['age_group'].astype('category')
+        self.merged_df['age_group'] = pd.cut(
+            self.merged_df['age_back'].astype('float32'),
+            bins=[-np.inf, 25, 35, 45, 55, 65, np.inf],
+            labels=['18-24', '25-34', '35-44', '45-54', '55-64', '65+'],
+            right=False,
+            ordered=False
+        ).cat.add_categories(['Неизвестно']).fillna('Неизвестно')
 
         logger.info(f"Создано признаков. Итоговая форма: {self.merged_df.shape}")
         self.stats['merged_df_shape'] = self.merged_df.shape
@@ -262,73 +639,82 @@ class DataPreprocessor:
         html_path.mkdir(parents=True, exist_ok=True)
         json_path.mkdir(parents=True, exist_ok=True)
 
-        # Попытка использовать ydata-profiling
-        try:
-            from ydata_profiling import ProfileReport
-
-            # ==========================================
-            # ПРОФИЛЬ ДЛЯ MERGED_DF
-            # ==========================================
-
-            # Для больших датасетов используем выборку
-            sample_size = min(4000000, len(self.merged_df))
-            if len(self.merged_df) > sample_size:
-                logger.info(f"Используется выборка {sample_size} строк из {len(self.merged_df)} для профилирования")
-                merged_sample = self.merged_df.sample(n=sample_size, random_state=42)
-            else:
-                merged_sample = self.merged_df
-
-            logger.info("Создание профиля для merged_df...")
-            logger.info("Это может занять несколько минут...")
-
-            merged_report = ProfileReport(
-                merged_sample,
-                title='MCD Application - Complete Data Profile',
-                minimal=False,  # Полный отчёт со всеми деталями
-                explorative=True,
-                # Дополнительные настройки для детального анализа
-                correlations={
-                    "auto": {"calculate": True},
-                    "pearson": {"calculate": True},
-                    "spearman": {"calculate": True},
-                    "kendall": {"calculate": False},  # Медленно на больших данных
-                    "phi_k": {"calculate": True},
-                    "cramers": {"calculate": True},
-                },
-                interactions={
-                    "continuous": True,
-                    "targets": []
-                },
-                missing_diagrams={
-                    "heatmap": True,
-                    "dendrogram": True,
-                    "matrix": True,
-                    "bar": True
-                }
-            )
-
-            # ==========================================
-            # СОХРАНЕНИЕ HTML
-            # ==========================================
-            logger.info("Сохранение HTML профиля...")
-            merged_report.to_file(str(html_path / 'merged_data_profile.html'))
-            logger.info(f"✓ HTML профиль сохранён: {html_path / 'merged_data_profile.html'}")
-
-            # ==========================================
-            # СОХРАНЕНИЕ ПОЛНОГО JSON ПРОФИЛЯ
-            # ==========================================
-            logger.info("Сохранение полного JSON профиля...")
-            merged_json = merged_report.to_json()
-            with open(json_path / 'merged_data_profile_full.json', 'w', encoding='utf-8') as f:
-                f.write(merged_json)
-            logger.info(f"✓ Полный JSON профиль сохранён: {json_path / 'merged_data_profile_full.json'}")
-
-        except ImportError:
-            logger.warning("ydata-profiling не установлен, пропускаем HTML и полные JSON отчеты")
-            logger.info("Установите: pip install ydata-profiling")
-        except Exception as e:
-            logger.warning(f"Ошибка при создании профиля: {e}")
-            logger.info("Продолжаем с созданием краткого summary...")
+        # Полный ydata-профиль (корреляции phi_k/cramers) очень тяжёлый - только по флагу в конфиге
+        profiling_config = self.config.get('profiling', {})
+        full_report = profiling_config.get('generate_html', False)
+
+        if full_report:
+            # Попытка использовать ydata-profiling
+            try:
+                from ydata_profiling import ProfileReport
+
+                # ==========================================
+                # ПРОФИЛЬ ДЛЯ MERGED_DF
+                # ==========================================
+
+                # Для больших датасетов используем выборку: каждая step-я строка -
+                # срез без случайного доступа и копирования всех колонок
+                sample_size = min(4000000, len(self.merged_df))
+                if len(self.merged_df) > sample_size:
+                    step = -(-len(self.merged_df) // sample_size)
+                    merged_sample = self.merged_df.iloc[::step]
+                    logger.info(f"Используется выборка {len(merged_sample)} строк из {len(self.merged_df)} для профилирования")
+                else:
+                    merged_sample = self.merged_df
+
+                logger.info("Создание профиля для merged_df...")
+                logger.info("Это может занять несколько минут...")
+
+                merged_report = ProfileReport(
+                    merged_sample,
+                    title='MCD Application - Complete Data Profile',
+                    minimal=profiling_config.get('minimal_mode', False),
+                    explorative=True,
+                    # Дополнительные настройки для детального анализа
+                    correlations={
+                        "auto": {"calculate": True},
+                        "pearson": {"calculate": True},
+                        "spearman": {"calculate": True},
+                        "kendall": {"calculate": False},  # Медленно на больших данных
+                        "phi_k": {"calculate": True},
+                        "cramers": {"calculate": True},
+                    },
+                    interactions={
+                        "continuous": True,
+                        "targets": []
+                    },
+                    missing_diagrams={
+                        "heatmap": True,
+                        "dendrogram": True,
+                        "matrix": True,
+                        "bar": True
+                    }
+                )
+
+                # ==========================================
+                # СОХРАНЕНИЕ HTML
+                # ==========================================
+                logger.info("Сохранение HTML профиля...")
+                merged_report.to_file(str(html_path / 'merged_data_profile.html'))
+                logger.info(f"✓ HTML профиль сохранён: {html_path / 'merged_data_profile.html'}")
+
+                # ==========================================
+                # СОХРАНЕНИЕ ПОЛНОГО JSON ПРОФИЛЯ
+                # ==========================================
+                logger.info("Сохранение полного JSON профиля...")
+                merged_json = merged_report.to_json()
+                with open(json_path / 'merged_data_profile_full.json', 'w', encoding='utf-8') as f:
+                    f.write(merged_json)
+                logger.info(f"✓ Полный JSON профиль сохранён: {json_path / 'merged_data_profile_full.json'}")
+
+            except ImportError:
+                logger.warning("ydata-profiling не установлен, пропускаем HTML и полные JSON отчеты")
+                logger.info("Установите: pip install ydata-profiling")
+            except Exception as e:
+                logger.warning(f"Ошибка при создании профиля: {e}")
+                logger.info("Продолжаем с созданием краткого summary...")
+        else:
+            logger.info("Полный профиль отключён (profiling.generate_html), создаётся только краткий summary")
 
         # ==========================================
         # СОЗДАНИЕ КРАТКОГО JSON SUMMARY
@@ -346,8 +732,9 @@ class DataPreprocessor:
         print(f"\n{'=' * 80}")
         print("ПРОФИЛИ ДАННЫХ СОЗДАНЫ:")
         print(f"{'=' * 80}")
-        print(f"📊 HTML отчёт:        {html_path / 'merged_data_profile.html'}")
-        print(f"📄 JSON (полный):     {json_path / 'merged_data_profile_full.json'}")
+        if full_report:
+            print(f"📊 HTML отчёт:        {html_path / 'merged_data_profile.html'}")
+            print(f"📄 JSON (полный):     {json_path / 'merged_data_profile_full.json'}")
         print(f"📋 JSON (summary):    {json_path / 'data_profile_summary.json'}")
         print(f"{'=' * 80}\n")
 
@@ -387,13 +774,16 @@ class DataPreprocessor:
             }
         }
         
-        # Информация по колонкам
-        for col in self.events_df.columns:
+        # Информация по колонкам - пропуски и уникальные значения сразу по всему DataFrame
+        null_counts = self.events_df.isna().sum()
+        unique_counts = self.events_df.nunique()
+        n_rows = len(self.events_df)
+        for col, dtype in self.events_df.dtypes.items():
             summary['events']['columns_info'][col] = {
-                'dtype': str(self.events_df[col].dtype),
-                'null_count': int(self.events_df[col].isna().sum()),
-                'null_percentage': float(self.events_df[col].isna().sum() / len(self.events_df) * 100),
-                'unique_values': int(self.events_df[col].nunique())
+                'dtype': str(dtype),
+                'null_count': int(null_counts[col]),
+                'null_percentage': float(null_counts[col] / n_rows * 100),
+                'unique_values': int(unique_counts[col])
             }
         
         # Топ экраны и функции
@@ -439,155 +829,261 @@ class DataPreprocessor:
         
         return summary
 
-    def save_processed_data(self) -> None:
+    def run_lazy_pipeline(self, output_path: str = None) -> Path:
         """
-        Сохранение обработанных данных в CSV
+        Потоковый pipeline на Polars LazyFrame: загрузка -> очистка -> признаки -> join -> Parquet
+
+        Повторяет load_data + clean_data + create_features + save_processed_data,
+        но не держит в памяти промежуточные копии всего датасета. Результат
+        читается через load_merged_data(path).
+
+        Args:
+            output_path: путь к Parquet (если None, используется data/processed/merged_data_lazy.parquet -
+                         отдельный файл, чтобы не перезаписать обработанный merged_data.parquet)
+
+        Returns:
+            Путь к сохранённому файлу
+        """
+        if pl is None:
+            raise ImportError("Для run_lazy_pipeline нужен polars: pip install polars")
+
+        logger.info("Запуск потокового pipeline (Polars LazyFrame)...")
+
+        raw_path = Path(self.config['data']['raw_path'])
+        events_file = raw_path / self.config['data']['events_file']
+        users_file = raw_path / self.config['data']['users_file']
+
+        if output_path is None:
+            output_path = Path(self.config['data']['processed_path']) / 'merged_data_lazy.parquet'
+        output_path = Path(output_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+
+        date_col = 'Дата и время события'
+        schema_overrides, enum_cols = self._polars_events_schema(self.EVENTS_DTYPES)
+
+        # Категории без фиксированного набора читаем строками и приводим к Enum из отсортированных
+        # значений - как у pandas-пути (Polars Categorical хранит категории в порядке появления).
+        # Значения собираются отдельным проходом только по этим колонкам
+        sorted_cols = [col for col, dtype in schema_overrides.items() if dtype == pl.Categorical]
+        schema_overrides.update({col: pl.Utf8 for col in sorted_cols})
+        value_sets = pl.scan_csv(events_file, schema_overrides=schema_overrides).select(
+            *[pl.col(col).drop_nulls().unique().implode() for col in sorted_cols],
+            pl.col('Действие').null_count().alias('_action_nulls')
+        ).collect().row(0, named=True)
+        if value_sets.pop('_action_nulls') > 0:
+            # fillna('Не указано') в clean_data добавляет эту категорию
+            value_sets['Действие'] = value_sets['Действие'] + ['Не указано']
+        enum_cols.update({col: pl.Enum(sorted(set(value_sets[col]))) for col in sorted_cols})
+
+        events = (
+            pl.scan_csv(events_file, schema_overrides=schema_overrides)
+            .with_columns(
+                self._polars_parse_date(date_col),
+                *[pl.col(col).cast(enum, strict=False) for col, enum in enum_cols.items()]
+            )
+            # Очистка - в том же порядке, что и clean_data
+            .unique(maintain_order=True)
+            .with_columns(pl.col('Действие').fill_null(pl.lit('Не указано', dtype=enum_cols['Действие'])))
+            .drop_nulls([date_col, 'Идентификатор устройства'])
+        )
+
+        hour = pl.col(date_col).dt.hour()
+        events = events.with_columns(
+            pl.col(date_col).dt.date().cast(pl.Datetime('ms')).alias('date'),
+            hour.cast(pl.Int8).alias('hour'),
+            (pl.col(date_col).dt.weekday() - 1).cast(pl.Int8).alias('day_of_week'),
+            (pl.col(date_col).dt.weekday() >= 6).alias('is_weekend'),
+            pl.col(date_col).dt.month().cast(pl.Int8).alias('month'),
+            pl.col(date_col).dt.day().cast(pl.Int8).alias('day'),
+            pl.when(hour < 6).then(pl.lit('Ночь'))
+            .when(hour < 12).then(pl.lit('Утро'))
+            .when(hour < 18).then(pl.lit('День'))
+            .otherwise(pl.lit('Вечер'))
+            .cast(pl.Enum(['Ночь', 'Утро', 'День', 'Вечер', 'Неизвестно']))
+            .alias('time_of_day')
+        )
+
+        # age_back читается как Float64: pandas пишет целые колонки с NA как '25.0'
+        users = pl.scan_csv(
+            users_file,
+            schema_overrides={'number': pl.Int32, 'gender': pl.Utf8, 'age_back': pl.Float64}
+        )
+        genders = users.select(pl.col('gender').drop_nulls().unique()).collect().to_series().to_list()
+        users = users.with_columns(
+            pl.col('gender').cast(pl.Enum(sorted(genders))),
+            pl.col('age_back').cast(pl.Int16)
+        ).unique(maintain_order=True)
+
+        age = pl.col('age_back')
+        merged = (
+            events
+            .join(users, left_on='Идентификатор устройства', right_on='number', how='left',
+                  coalesce=False, maintain_order='left')
+            .with_columns(
+                pl.when(age.is_null()).then(pl.lit('Неизвестно'))
+                .when(age < 25).then(pl.lit('18-24'))
+                .when(age < 35).then(pl.lit('25-34'))
+                .when(age < 45).then(pl.lit('35-44'))
+                .when(age < 55).then(pl.lit('45-54'))
+                .when(age < 65).then(pl.lit('55-64'))
+                .otherwise(pl.lit('65+'))
+                .cast(pl.Enum(['18-24', '25-34', '35-44', '45-54', '55-64', '65+', 'Неизвестно']))
+                .alias('age_group')
+            )
+        )
+
+        merged.sink_parquet(output_path, compression='zstd')
+
+        file_size = output_path.stat().st_size / 1024 ** 2
+        logger.info(f"✓ Merged_df сохранён: {output_path} ({file_size:.2f} MB)")
+
+        return output_path
+
+    def save_processed_data(self, save_csv: bool = False) -> None:
+        """
+        Сохранение обработанных данных в Parquet (zstd)
+
+        Args:
+            save_csv: дополнительно сохранить CSV для ручного просмотра
         """
         logger.info("Сохранение обработанных данных...")
 
         processed_path = Path(self.config['data']['processed_path'])
         processed_path.mkdir(parents=True, exist_ok=True)
 
-        # Сохранение merged_df в CSV
+        # Сохранение merged_df
         if self.merged_df is not None and len(self.merged_df) > 0:
-            csv_file = processed_path / 'merged_data_test.csv'
-            logger.info(f"Сохранение в {csv_file}...")
+            parquet_file = processed_path / 'merged_data_test.parquet'
+            logger.info(f"Сохранение в {parquet_file}...")
+            self.merged_df.to_parquet(parquet_file, engine='pyarrow', compression='zstd', index=False)
 
-            # Конвертация date в string для CSV
-            df_to_save = self.merged_df.copy()
-            if 'date' in df_to_save.columns:
-                df_to_save['date'] = df_to_save['date'].astype(str)
+            file_size = parquet_file.stat().st_size / 1024 ** 2
+            logger.info(f"✓ Merged_df сохранён: {parquet_file} ({file_size:.2f} MB)")
 
-            df_to_save.to_csv(csv_file, index=False, encoding='utf-8')
+            if save_csv:
+                csv_file = parquet_file.with_suffix('.csv')
+                # date (datetime64 без времени) пишется как YYYY-MM-DD;
+                # chunksize ограничивает буфер форматирования строк, а не весь DataFrame
+                self.merged_df.to_csv(csv_file, index=False, encoding='utf-8', chunksize=1_000_000)
+                logger.info(f"✓ CSV-копия сохранена: {csv_file}")
 
-            file_size = csv_file.stat().st_size / 1024 ** 2
-            logger.info(f"✓ Merged_df сохранён: {csv_file} ({file_size:.2f} MB)")
-
-        # Также сохраняем очищенные events в CSV (опционально)
+        # Также сохраняем очищенные events (опционально)
         if self.events_df is not None and len(self.events_df) > 0:
-            events_csv = processed_path / 'events_cleaned.csv'
-            logger.info(f"Сохранение очищенных событий в {events_csv}...")
-
-            df_to_save = self.events_df.copy()
-            if 'date' in df_to_save.columns:
-                df_to_save['date'] = df_to_save['date'].astype(str)
+            events_parquet = processed_path / 'events_cleaned.parquet'
+            logger.info(f"Сохранение очищенных событий в {events_parquet}...")
 
-            df_to_save.to_csv(events_csv, index=False, encoding='utf-8')
-            logger.info(f"✓ Очищенные события сохранены: {events_csv}")
+            self.events_df.to_parquet(events_parquet, engine='pyarrow', compression='zstd', index=False)
+            if save_csv:
+                self.events_df.to_csv(
+                    events_parquet.with_suffix('.csv'), index=False, encoding='utf-8', chunksize=1_000_000
+                )
+            logger.info(f"✓ Очищенные события сохранены: {events_parquet}")
 
         logger.info("Сохранение завершено")
 
-    def load_merged_data_base(self, path: str = None) -> pd.DataFrame:
+    def _default_merged_path(self) -> Path:
         """
-        Загрузка ранее сохранённого merged_df из CSV с правильной типизацией
+        Путь к сохранённому merged_df по умолчанию: Parquet, если есть, иначе CSV
+        """
+        processed_path = Path(self.config['data']['processed_path'])
+        parquet_file = processed_path / 'merged_data.parquet'
+        return parquet_file if parquet_file.exists() else processed_path / 'merged_data.csv'
+
+    def save_merged_data_parquet(self, path: str = None) -> Path:
+        """
+        Сохранение merged_df в Parquet для быстрой загрузки через load_merged_data_parquet
 
         Args:
-            path: путь к файлу CSV (если None, используется data/processed/merged_data.csv)
+            path: путь к файлу (если None, используется data/processed/merged_data.parquet)
 
         Returns:
-            DataFrame с правильными типами
+            Путь к сохранённому файлу
         """
-        logger.info("Загрузка сохранённого merged_df из CSV...")
+        if self.merged_df is None:
+            raise ValueError("merged_df не создан. Запустите обработку данных сначала.")
 
         if path is None:
-            processed_path = Path(self.config['data']['processed_path'])
-            path = processed_path / 'merged_data.csv'
+            path = Path(self.config['data']['processed_path']) / 'merged_data.parquet'
 
         path = Path(path)
-        if not path.exists():
-            raise FileNotFoundError(
-                f"Файл не найден: {path}\n"
-                f"Запустите полную обработку данных сначала."
-            )
-
-        # Загрузка из CSV
-        logger.info(f"Чтение файла: {path}")
-        self.merged_df = pd.read_csv(path, low_memory=False)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Словарное кодирование сжимает низкокардинальные Экран/Функционал/Действие;
+        # row groups по 200k строк позволяют читать файл частями
+        self.merged_df.to_parquet(
+            path,
+            engine='pyarrow',
+            compression='zstd',
+            use_dictionary=True,
+            row_group_size=200_000,
+            index=False
+        )
 
-        logger.info(f"Загружено {len(self.merged_df):,} строк, {len(self.merged_df.columns)} колонок")
+        file_size = path.stat().st_size / 1024 ** 2
+        logger.info(f"✓ Merged_df сохранён: {path} ({file_size:.2f} MB)")
 
-        # Восстановление правильных типов данных
-        logger.info("Восстановление типов данных...")
+        return path
 
-        # DateTime колонка
-        if 'Дата и время события' in self.merged_df.columns:
-            logger.debug("Конвертация 'Дата и время события' в datetime...")
-            self.merged_df['Дата и время события'] = pd.to_datetime(
-                self.merged_df['Дата и время события'],
-                utc=True,
-                errors='coerce'
-            )
+    def load_merged_data_parquet(self, path: str = None, columns: List[str] = None) -> pd.DataFrame:
+        """
+        Быстрая загрузка merged_df из Parquet: типы берутся из схемы файла, без восстановления
 
-        # Categorical колонки
-        categorical_cols = [
-            'Экран', 'Функционал', 'Действие',
-            'Производитель устройства', 'Модель устройства',
-            'Тип устройства', 'ОС', 'time_of_day',
-            'gender', 'age_group'
-        ]
+        Args:
+            path: путь к файлу Parquet (если None, используется data/processed/merged_data.parquet)
+            columns: загружаемые колонки (если None - все); позволяет не читать funnel features
 
-        for col in categorical_cols:
-            if col in self.merged_df.columns:
-                logger.debug(f"Конвертация {col} в category")
-                self.merged_df[col] = self.merged_df[col].astype('category')
+        Returns:
+            DataFrame с типами, сохранёнными в файле
+        """
+        logger.info("Загрузка сохранённого merged_df из Parquet...")
 
-        # Boolean колонка
-        if 'is_weekend' in self.merged_df.columns:
-            self.merged_df['is_weekend'] = self.merged_df['is_weekend'].astype('bool')
+        if path is None:
+            path = Path(self.config['data']['processed_path']) / 'merged_data.parquet'
 
-        # Integer колонки с оптимизацией памяти
-        int_cols = {
-            'Идентификатор устройства': 'int32',
-            'Номер сессии в рамках устройства': 'int64',
-            'hour': 'int8',
-            'day_of_week': 'int8',
-            'month': 'int8',
-            'day': 'int8',
-            'number': 'int32'
-        }
+        path = Path(path)
+        if not path.exists():
+            raise FileNotFoundError(
+                f"Файл не найден: {path}\n"
+                f"Сохраните данные через save_merged_data_parquet сначала."
+            )
 
-        for col, dtype in int_cols.items():
-            if col in self.merged_df.columns:
-                logger.debug(f"Конвертация {col} в {dtype}")
-                self.merged_df[col] = self.merged_df[col].astype(dtype)
+        logger.info(f"Чтение файла: {path}")
+        self.merged_df = pq.read_table(path, columns=columns, use_threads=True).to_pandas(self_destruct=True)
 
-        # Nullable integer для age_back
-        if 'age_back' in self.merged_df.columns:
-            self.merged_df['age_back'] = pd.to_numeric(
-                self.merged_df['age_back'],
-                errors='coerce'
-            ).astype('Int16')
+        logger.info(f"Загружено {len(self.merged_df):,} строк, {len(self.merged_df.columns)} колонок")
 
-        # Конвертация date обратно в date (из string)
+        # date - полночь дня в datetime64[s] (Parquet возвращает [ms])
         if 'date' in self.merged_df.columns:
-            self.merged_df['date'] = pd.to_datetime(
-                self.merged_df['date'],
-                errors='coerce'
-            ).dt.date
+            self.merged_df['date'] = self.merged_df['date'].astype('datetime64[s]')
 
-        # Проверка памяти
-        memory_usage = self.merged_df.memory_usage(deep=True).sum() / 1024 ** 2
+        present_cols = set(self.merged_df.columns)
+        self._log_pipeline_status(present_cols)
+        if any(col.startswith(f'{prefix}_') for col in present_cols for prefix in self.FUNNEL_PREFIXES):
+            self._log_funnel_status(present_cols)
+
+        memory_usage = self._memory_usage_mb(self.merged_df)
         logger.info(f"Использование памяти: {memory_usage:.2f} MB")
 
         logger.info("✓ Загрузка merged_df завершена успешно")
 
         return self.merged_df
 
-    def load_merged_data(self, path: str = None) -> pd.DataFrame:
+    def load_merged_data(self, path: str = None, report_pipeline_status: bool = True) -> pd.DataFrame:
         """
-        Загрузка ранее сохранённого merged_df из CSV с правильной типизацией
+        Загрузка ранее сохранённого merged_df из Parquet/CSV с правильной типизацией
 
         Args:
-            path: путь к файлу CSV (если None, используется data/processed/merged_data.csv)
+            path: путь к файлу Parquet или CSV (если None, используется
+                  data/processed/merged_data.parquet, а при его отсутствии merged_data.csv)
+            report_pipeline_status: вывести в лог статус колонок pipeline обработки
 
         Returns:
             DataFrame с правильными типами
         """
-        logger.info("Загрузка сохранённого merged_df из CSV...")
+        logger.info("Загрузка сохранённого merged_df...")
 
         if path is None:
-            processed_path = Path(self.config['data']['processed_path'])
-            path = processed_path / 'merged_data.csv'
+            path = self._default_merged_path()
 
         path = Path(path)
         if not path.exists():
@@ -596,17 +1092,28 @@ class DataPreprocessor:
                 f"Запустите полную обработку данных сначала."
             )
 
-        # Загрузка из CSV
+        # Parquet хранит типы колонок, CSV требует их восстановления ниже
         logger.info(f"Чтение файла: {path}")
-        self.merged_df = pd.read_csv(path, low_memory=False)
+        from_csv = path.suffix != '.parquet'
+        if from_csv:
+            logger.warning(
+                "Загрузка из CSV устарела и требует восстановления типов; "
+                "используйте save_merged_data_parquet / load_merged_data_parquet"
+            )
+            self.merged_df = pd.read_csv(path, low_memory=False)
+        else:
+            self.merged_df = pd.read_parquet(path)
 
         logger.info(f"Загружено {len(self.merged_df):,} строк, {len(self.merged_df.columns)} колонок")
 
+        # Набор колонок не меняется при восстановлении типов - проверяем членство по set
+        present_cols = set(self.merged_df.columns)
+
         # Восстановление правильных типов данных
         logger.info("Восстановление типов данных...")
 
         # DateTime колонка
-        if 'Дата и время события' in self.merged_df.columns:
+        if from_csv and 'Дата и время события' in present_cols:
             logger.debug("Конвертация 'Дата и время события' в datetime...")
             self.merged_df['Дата и время события'] = pd.to_datetime(
                 self.merged_df['Дата и время события'],
@@ -614,60 +1121,41 @@ class DataPreprocessor:
                 errors='coerce'
             )
 
-        # Categorical колонки
-        categorical_cols = [
-            'Экран', 'Функционал', 'Действие',
-            'Производитель устройства', 'Модель устройства',
-            'Тип устройства', 'ОС', 'time_of_day',
-            'gender', 'age_group'
-        ]
-
-        for col in categorical_cols:
-            if col in self.merged_df.columns:
-                logger.debug(f"Конвертация {col} в category")
-                self.merged_df[col] = self.merged_df[col].astype('category')
+        categorical_cols = self.MERGED_CATEGORICAL_COLS
 
-        # Boolean колонка
-        if 'is_weekend' in self.merged_df.columns:
-            self.merged_df['is_weekend'] = self.merged_df['is_weekend'].astype('bool')
+        # Categorical и boolean колонки - одним astype по словарю типов
+        # (неупорядоченные: Enum-колонки из run_lazy_pipeline читаются как упорядоченные категории)
+        unordered = pd.CategoricalDtype(ordered=False)
+        type_map = {col: unordered for col in categorical_cols if col in present_cols}
+        if 'is_weekend' in present_cols:
+            type_map['is_weekend'] = 'bool'
+        self.merged_df = self.merged_df.astype(type_map, copy=False)
 
         # Integer колонки с оптимизацией памяти
-        int_cols = {
-            # Основные колонки
-            'Идентификатор устройства': 'int32',
-            'Номер сессии в рамках устройства': 'int64',
-            'hour': 'int8',
-            'day_of_week': 'int8',
-            'month': 'int8',
-            'day': 'int8',
-            'number': 'int32',
-            'global_session_id': 'int32',  # Глобальный ID сессии (до ~1M)
-            'duration_seconds': 'int32',  # Длительность события (секунды)
-            'click_count': 'int16',  # Количество кликов (1-100)
-            'dbl_duration_seconds': 'int32',  # Длительность удалённых дублей
-            'dbl_count': 'int16'  # Количество удалённых дублей
-        }
+        int_cols = self.MERGED_INT_COLS
 
-        for col, dtype in int_cols.items():
-            if col in self.merged_df.columns:
+        present_int_cols = {col: dtype for col, dtype in int_cols.items() if col in present_cols}
+
+        try:
+            self.merged_df[list(present_int_cols)] = (
+                self.merged_df[list(present_int_cols)]
+                .apply(pd.to_numeric, errors='coerce')
+                .fillna(0)
+                .astype(present_int_cols)
+            )
+        except Exception as e:
+            logger.warning(f"Не удалось конвертировать int-колонки одним проходом: {e}")
+
+            # Поколоночно, с fallback на более широкий тип
+            for col, dtype in present_int_cols.items():
                 try:
-                    logger.debug(f"Конвертация {col} в {dtype}")
                     self.merged_df[col] = pd.to_numeric(
                         self.merged_df[col],
                         errors='coerce'
                     ).fillna(0).astype(dtype)
                 except Exception as e:
                     logger.warning(f"Не удалось конвертировать {col} в {dtype}: {e}")
-                    # Fallback на более широкий тип
-                    if dtype == 'int8':
-                        fallback_dtype = 'int16'
-                    elif dtype == 'int16':
-                        fallback_dtype = 'int32'
-                    elif dtype == 'int32':
-                        fallback_dtype = 'int64'
-                    else:
-                        fallback_dtype = 'int64'
-
+                    fallback_dtype = self.WIDER_INT_DTYPE[dtype]
                     logger.warning(f"Использую fallback тип {fallback_dtype}")
                     self.merged_df[col] = pd.to_numeric(
                         self.merged_df[col],
@@ -675,46 +1163,77 @@ class DataPreprocessor:
                     ).fillna(0).astype(fallback_dtype)
 
         # Nullable integer для age_back
-        if 'age_back' in self.merged_df.columns:
+        if 'age_back' in present_cols:
             self.merged_df['age_back'] = pd.to_numeric(
                 self.merged_df['age_back'],
                 errors='coerce'
             ).astype('Int16')
 
-        # Конвертация date обратно в date (из string)
-        if 'date' in self.merged_df.columns:
-            self.merged_df['date'] = pd.to_datetime(
-                self.merged_df['date'],
-                errors='coerce'
-            ).dt.date
+        # date - полночь дня в datetime64[s] (Parquet возвращает [ms], CSV - строки)
+        if 'date' in present_cols:
+            date_col = self.merged_df['date']
+            if from_csv:
+                date_col = pd.to_datetime(date_col, errors='coerce')
+            self.merged_df['date'] = date_col.astype('datetime64[s]')
 
-        # ============================================================
-        # СТАТУС НОВЫХ КОЛОНОК ОБРАБОТКИ
-        # ============================================================
+        if report_pipeline_status:
+            self._log_pipeline_status(present_cols)
+
+        # Проверка памяти
+        memory_usage = self._memory_usage_mb(self.merged_df)
+        logger.info(f"Использование памяти: {memory_usage:.2f} MB")
+
+        logger.info("✓ Загрузка merged_df завершена успешно")
+
+        return self.merged_df
+
+    @staticmethod
+    def _memory_usage_mb(df: pd.DataFrame) -> float:
+        """
+        Память DataFrame в MB: поверхностный подсчёт для числовых, категориальных и datetime колонок,
+        глубокий - только для оставшихся object-колонок
+        """
+        memory_usage = df.memory_usage(deep=False, index=True).sum()
+        object_cols = df.select_dtypes(include='object').columns
+        if len(object_cols) > 0:
+            memory_usage += df[object_cols].memory_usage(deep=True, index=False).sum()
+            memory_usage -= df[object_cols].memory_usage(deep=False, index=False).sum()
+        return memory_usage / 1024 ** 2
+
+    def _log_pipeline_status(self, present_cols: set, session_gb=None) -> None:
+        """
+        Вывод в лог статуса колонок, добавляемых шагами pipeline обработки
 
+        Args:
+            present_cols: множество колонок merged_df
+            session_gb: готовая группировка merged_df по global_session_id (если уже построена)
+        """
         pipeline_cols_status = {}
 
-        if 'global_session_id' in self.merged_df.columns:
-            unique_sessions = self.merged_df['global_session_id'].nunique()
+        if 'global_session_id' in present_cols:
+            if session_gb is not None:
+                unique_sessions = session_gb.ngroups
+            else:
+                unique_sessions = self.merged_df['global_session_id'].nunique()
             pipeline_cols_status['global_session_id'] = f"✓ {unique_sessions:,} уникальных сессий"
         else:
             pipeline_cols_status['global_session_id'] = "✗ Не найден (выполните add_global_session_id)"
 
-        if 'duration_seconds' in self.merged_df.columns:
+        if 'duration_seconds' in present_cols:
             avg_duration = self.merged_df['duration_seconds'].mean()
             max_duration = self.merged_df['duration_seconds'].max()
             pipeline_cols_status['duration_seconds'] = f"✓ Среднее: {avg_duration:.1f}с, Макс: {max_duration:,}с"
         else:
             pipeline_cols_status['duration_seconds'] = "✗ Не найден (выполните calculate_event_duration)"
 
-        if 'click_count' in self.merged_df.columns:
+        if 'click_count' in present_cols:
             avg_tries = self.merged_df['click_count'].mean()
             max_tries = self.merged_df['click_count'].max()
             pipeline_cols_status['click_count'] = f"✓ Среднее: {avg_tries:.2f}, Макс: {max_tries}"
         else:
             pipeline_cols_status['click_count'] = "✗ Не найден (выполните remove_consecutive_duplicates_with_tries)"
 
-        if 'dbl_duration_seconds' in self.merged_df.columns:
+        if 'dbl_duration_seconds' in present_cols:
             avg_dbl_dur = self.merged_df['dbl_duration_seconds'].mean()
             sum_dbl_dur = self.merged_df['dbl_duration_seconds'].sum()
             pipeline_cols_status[
@@ -723,7 +1242,7 @@ class DataPreprocessor:
             pipeline_cols_status[
                 'dbl_duration_seconds'] = "✗ Не найден (выполните remove_consecutive_duplicates_with_tries)"
 
-        if 'dbl_count' in self.merged_df.columns:
+        if 'dbl_count' in present_cols:
             avg_dbl = self.merged_df['dbl_count'].mean()
             max_dbl = self.merged_df['dbl_count'].max()
             pipeline_cols_status['dbl_count'] = f"✓ Среднее: {avg_dbl:.2f}, Макс: {max_dbl}"
@@ -739,352 +1258,539 @@ class DataPreprocessor:
                 logger.info(f"  {col_name}: {status}")
             logger.info(f"{'=' * 60}\n")
 
+    def _log_funnel_status(self, present_cols: set, session_gb=None) -> List[str]:
+        """
+        Вывод в лог статуса колонок funnel features (функциональных блоков)
+
+        Args:
+            present_cols: множество колонок merged_df
+            session_gb: готовая группировка merged_df по global_session_id (если None - строится здесь)
+
+        Returns:
+            Список найденных funnel-колонок
+        """
+        # Проверяем наличие funnel features
+        funnel_cols_found = [col for col in self.merged_df.columns
+                             if any(col.startswith(f'{prefix}_') for prefix in self.FUNNEL_PREFIXES)]
+
+        funnel_features_status = {}
+
+        if funnel_cols_found:
+            # Подсчитываем сколько колонок найдено для каждого блока
+            blocks_with_features = {}
+            for prefix in self.FUNNEL_PREFIXES:
+                prefix_cols = [col for col in funnel_cols_found if col.startswith(f'{prefix}_')]
+                if prefix_cols:
+                    blocks_with_features[prefix] = len(prefix_cols)
+
+            funnel_features_status['total_blocks'] = f"✓ {len(blocks_with_features)}/17 блоков"
+            funnel_features_status['total_columns'] = f"✓ {len(funnel_cols_found)}/68 колонок"
+        else:
+            funnel_features_status['status'] = (
+                "✗ Не найдено (выполните FunnelFeaturesExtractor.transform())"
+            )
+
+        # Вывод статуса funnel features
+        if funnel_features_status:
+            logger.info(f"\n{'=' * 70}")
+            logger.info("СТАТУС FUNNEL FEATURES (ФУНКЦИОНАЛЬНЫЕ БЛОКИ):")
+            logger.info(f"{'=' * 70}")
+            for key, status in funnel_features_status.items():
+                logger.info(f"  {key}: {status}")
+
+            # Детальная информация по блокам
+            if funnel_cols_found and 'global_session_id' in present_cols:
+                logger.info(f"\n  Детализация по блокам:")
+
+                # Значения *_count одинаковы в пределах сессии - одна группировка на все блоки
+                present_count_cols = [f'{p}_count' for p in self.FUNNEL_PREFIXES if f'{p}_count' in present_cols]
+                if session_gb is None:
+                    session_gb = self.merged_df.groupby('global_session_id', sort=False, observed=True)
+                session_firsts = session_gb[present_count_cols].first()
+
+                # Сводка по блокам одной таблицей: сессии с блоком, действия, среднее по сессиям с блоком
+                summary = pd.DataFrame({
+                    'sessions': (session_firsts > 0).sum(),
+                    'actions': session_firsts.sum().astype(np.int64),
+                    'avg': session_firsts.where(session_firsts > 0).mean()
+                })
+                summary['percent'] = 100 * summary['sessions'] / len(session_firsts)
+                summary.index = summary.index.str.removesuffix('_count')
+
+                # Сортируем и показываем топ-5
+                summary = summary[summary['sessions'] > 0].sort_values('sessions', ascending=False, kind='stable')
+                for i, block in enumerate(summary.head(5).itertuples(), 1):
+                    logger.info(
+                        f"    {i}. {block.Index:12s}: "
+                        f"{block.sessions:6,} сессий ({block.percent:4.1f}%), "
+                        f"{block.actions:7,} действий, "
+                        f"среднее: {block.avg:.2f}"
+                    )
+
+                if len(summary) > 5:
+                    logger.info(f"    ... и ещё {len(summary) - 5} блоков")
+
+            logger.info(f"{'=' * 70}\n")
+
+        return funnel_cols_found
+
+    @classmethod
+    def _fit_int_dtype(cls, col: str, dtype: str, col_min, col_max) -> str:
+        """
+        Подбор int-типа: исходный, если значения помещаются, иначе ближайший более широкий
+
+        Args:
+            col: имя колонки (для лога)
+            dtype: целевой тип
+            col_min: минимум колонки (None для пустой)
+            col_max: максимум колонки
+
+        Returns:
+            Имя int-типа numpy
+        """
+        target = dtype
+        while (col_min is not None and target != 'int64'
+               and not np.iinfo(target).min <= col_min <= col_max <= np.iinfo(target).max):
+            target = cls.WIDER_INT_DTYPE[target]
+        if target != dtype:
+            logger.warning(f"Не удалось конвертировать {col} в {dtype}, использую fallback тип {target}")
+        return target
+
+    def _log_funnel_load_summary(self) -> None:
+        """
+        Вывод в лог статусов pipeline и funnel features и итоговой сводки загруженного merged_df
+        """
+        present_cols = set(self.merged_df.columns)
+
+        # Одна группировка по сессиям на все статусы: ключи хешируются один раз
+        session_gb = None
+        if 'global_session_id' in present_cols:
+            session_gb = self.merged_df.groupby('global_session_id', sort=False, observed=True)
+
+        self._log_pipeline_status(present_cols, session_gb)
+        funnel_cols_found = self._log_funnel_status(present_cols, session_gb)
+
         # Проверка памяти
-        memory_usage = self.merged_df.memory_usage(deep=True).sum() / 1024 ** 2
+        memory_usage = self._memory_usage_mb(self.merged_df)
         logger.info(f"Использование памяти: {memory_usage:.2f} MB")
 
-        logger.info("✓ Загрузка merged_df завершена успешно")
+        # Итоговая сводка
+        logger.info(f"\n{'=' * 70}")
+        logger.info("ИТОГОВАЯ СВОДКА ЗАГРУЖЕННОГО ДАТАСЕТА:")
+        logger.info(f"{'=' * 70}")
+        logger.info(f"  Строк: {len(self.merged_df):,}")
+        logger.info(f"  Колонок: {len(self.merged_df.columns)}")
+        logger.info(f"  Период: {self.merged_df['date'].min()} - {self.merged_df['date'].max()}")
+        logger.info(f"  Память: {memory_usage:.2f} MB")
 
-        return self.merged_df
+        # Считаем сколько основных и funnel колонок
+        base_cols = len([c for c in self.merged_df.columns if not any(c.startswith(f'{p}_') for p in self.FUNNEL_PREFIXES)])
+        funnel_cols_count = len(funnel_cols_found)
 
-    def load_merged_data_funnel(self, path: str = None) -> pd.DataFrame:
+        logger.info(f"  Базовых колонок: {base_cols}")
+        if funnel_cols_count > 0:
+            logger.info(f"  Funnel features: {funnel_cols_count}")
+        logger.info(f"{'=' * 70}\n")
+
+    @classmethod
+    def _read_merged_csv_arrow(cls, path: Path, categorical_cols: list, int_cols: Dict) -> pd.DataFrame:
         """
-        Загрузка ранее сохранённого merged_df из CSV с правильной типизацией
-        Поддерживает колонки funnel features (68 колонок от FunnelFeaturesExtractor)
+        Чтение merged CSV многопоточным парсером Arrow сразу в целевые типы
 
         Args:
-            path: путь к файлу CSV (если None, используется data/processed/merged_data.csv)
+            path: путь к CSV
+            categorical_cols: колонки, читаемые как dictionary -> category
+            int_cols: целевые int-типы; пропуски заполняются -1 для *_max_step и 0 для остальных
 
         Returns:
-            DataFrame с правильными типами
+            DataFrame с восстановленными типами (кроме age_back и date)
         """
-        logger.info("Загрузка сохранённого merged_df из CSV...")
+        column_types = {
+            'Дата и время события': pa.timestamp('ns', tz='UTC'),
+            'is_weekend': pa.bool_()
+        }
+        column_types.update({col: pa.dictionary(pa.int32(), pa.string()) for col in categorical_cols})
+        # int-колонки с пропусками pandas пишет как float ("3.0") - читаем как float64 и приводим ниже
+        column_types.update({col: pa.float64() for col in int_cols})
+
+        table = pacsv.read_csv(
+            path,
+            read_options=pacsv.ReadOptions(use_threads=True, block_size=64 << 20),
+            convert_options=pacsv.ConvertOptions(column_types=column_types, strings_can_be_null=True)
+        )
 
-        if path is None:
-            processed_path = Path(self.config['data']['processed_path'])
-            path = processed_path / 'merged_data.csv'
+        for col, dtype in int_cols.items():
+            idx = table.schema.get_field_index(col)
+            if idx < 0:
+                continue
 
-        path = Path(path)
-        if not path.exists():
-            raise FileNotFoundError(
-                f"Файл не найден: {path}\n"
-                f"Запустите полную обработку данных сначала."
-            )
+            column = pc.fill_null(table.column(idx), -1 if col.endswith('_max_step') else 0)
 
-        # Загрузка из CSV
-        logger.info(f"Чтение файла: {path}")
-        self.merged_df = pd.read_csv(path, low_memory=False)
+            # Как astype в pandas: дробная часть отбрасывается, при переполнении - более широкий тип
+            min_max = pc.min_max(column)
+            target = cls._fit_int_dtype(col, dtype, min_max['min'].as_py(), min_max['max'].as_py())
 
-        logger.info(f"Загружено {len(self.merged_df):,} строк, {len(self.merged_df.columns)} колонок")
+            table = table.set_column(idx, col, pc.cast(column, pa.from_numpy_dtype(np.dtype(target)), safe=False))
 
-        # Восстановление правильных типов данных
-        logger.info("Восстановление типов данных...")
+        merged_df = table.to_pandas(split_blocks=True, self_destruct=True)
 
-        # DateTime колонка
-        if 'Дата и время события' in self.merged_df.columns:
-            logger.debug("Конвертация 'Дата и время события' в datetime...")
-            self.merged_df['Дата и время события'] = pd.to_datetime(
-                self.merged_df['Дата и время события'],
-                utc=True,
-                errors='coerce'
+        # Arrow хранит словарь в порядке появления, pandas.astype('category') - отсортированным
+        for col in categorical_cols:
+            if col in merged_df.columns:
+                merged_df[col] = merged_df[col].cat.reorder_categories(sorted(merged_df[col].cat.categories))
+
+        return merged_df
+
+    @classmethod
+    def _read_merged_csv_polars(cls, path: Path, categorical_cols: list, int_cols: Dict) -> pd.DataFrame:
+        """
+        Чтение merged CSV через Polars (многопоточный парсер) сразу в целевые типы
+
+        Args:
+            path: путь к CSV
+            categorical_cols: колонки, читаемые как Categorical -> category
+            int_cols: целевые int-типы; пропуски заполняются -1 для *_max_step и 0 для остальных
+
+        Returns:
+            DataFrame с восстановленными типами (кроме age_back и date)
+        """
+        time_col = 'Дата и время события'
+        present_cols = set(pl.read_csv(path, n_rows=0).columns)
+
+        schema_overrides = {col: pl.Categorical for col in categorical_cols if col in present_cols}
+        # int-колонки с пропусками pandas пишет как float ("3.0") - читаем как Float64 и приводим ниже
+        schema_overrides.update({col: pl.Float64 for col in int_cols if col in present_cols})
+        if 'is_weekend' in present_cols:
+            schema_overrides['is_weekend'] = pl.Boolean
+        if time_col in present_cols:
+            schema_overrides[time_col] = pl.Utf8
+
+        max_step_cols = [c for c in int_cols if c.endswith('_max_step') and c in present_cols]
+        other_int_cols = [c for c in int_cols if not c.endswith('_max_step') and c in present_cols]
+        numeric_cols = max_step_cols + other_int_cols
+
+        fill_exprs = [pl.col(max_step_cols).fill_null(-1), pl.col(other_int_cols).fill_null(0)]
+        if time_col in present_cols:
+            # pandas.to_csv пишет UTC-время как 2025-09-25 11:08:35+00:00
+            fill_exprs.append(
+                pl.col(time_col).str.to_datetime(
+                    format='%Y-%m-%d %H:%M:%S%.f%#z',
+                    time_unit='ns',
+                    time_zone='UTC',
+                    strict=False
+                )
             )
 
-        # Categorical колонки
-        categorical_cols = [
-            'Экран', 'Функционал', 'Действие',
-            'Производитель устройства', 'Модель устройства',
-            'Тип устройства', 'ОС', 'time_of_day',
-            'gender', 'age_group'
-        ]
+        # Один collect одного фрейма: общий StringCache для категорий не нужен
+        frame = (
+            pl.scan_csv(path, schema_overrides=schema_overrides, low_memory=False)
+            .with_columns(fill_exprs)
+            .collect()
+        )
+
+        # Границы всех int-колонок одним проходом, затем приведение с fallback на более широкий тип
+        pl_int_types = {'int8': pl.Int8, 'int16': pl.Int16, 'int32': pl.Int32, 'int64': pl.Int64}
+        mins = frame.select(pl.col(numeric_cols).min()).row(0, named=True)
+        maxs = frame.select(pl.col(numeric_cols).max()).row(0, named=True)
+        frame = frame.with_columns([
+            pl.col(col).cast(pl_int_types[cls._fit_int_dtype(col, int_cols[col], mins[col], maxs[col])])
+            for col in numeric_cols
+        ])
+
+        merged_df = frame.to_pandas()
 
+        # Polars хранит категории в порядке появления, pandas.astype('category') - отсортированными
         for col in categorical_cols:
-            if col in self.merged_df.columns:
-                logger.debug(f"Конвертация {col} в category")
-                self.merged_df[col] = self.merged_df[col].astype('category')
+            if col in merged_df.columns:
+                merged_df[col] = merged_df[col].cat.reorder_categories(sorted(merged_df[col].cat.categories))
 
-        # Boolean колонка
-        if 'is_weekend' in self.merged_df.columns:
-            self.merged_df['is_weekend'] = self.merged_df['is_weekend'].astype('bool')
+        return merged_df
 
-        # Integer колонки с оптимизацией памяти
-        int_cols = {
-            # Основные колонки
-            'Идентификатор устройства': 'int32',
-            'Номер сессии в рамках устройства': 'int64',
-            'hour': 'int8',
-            'day_of_week': 'int8',
-            'month': 'int8',
-            'day': 'int8',
-            'number': 'int32',
-            'global_session_id': 'int32',  # Глобальный ID сессии (до ~1M)
-            'duration_seconds': 'int32',  # Длительность события (секунды)
-            'click_count': 'int16',  # Количество кликов (1-100)
-            'dbl_duration_seconds': 'int32',  # Длительность удалённых дублей
-            'dbl_count': 'int16'  # Количество удалённых дублей
-        }
+    @classmethod
+    def _coerce_int_column(cls, series: pd.Series, col: str, dtype: str) -> np.ndarray:
+        """
+        Приведение колонки к int: нечисловое -> NaN, пропуски -> -1 для *_max_step
+        (блок не посещался) и 0 для остальных, тип расширяется, если значения не помещаются
+
+        Returns:
+            numpy-массив итогового int-типа
+        """
+        numeric = pd.to_numeric(series, errors='coerce').fillna(-1 if col.endswith('_max_step') else 0)
+        target = cls._fit_int_dtype(col, dtype, numeric.min() if len(numeric) else None, numeric.max())
+        return numeric.to_numpy().astype(target)
+
+    @classmethod
+    def _restore_merged_types(cls, df: pd.DataFrame, categorical_cols: list, int_cols: Dict) -> pd.DataFrame:
+        """
+        Восстановление типов merged_df (category, bool, int) после чтения без схемы
+
+        Args:
+            df: DataFrame или его чанк
+            categorical_cols: колонки для приведения к category
+            int_cols: целевые int-типы; пропуски заполняются -1 для *_max_step и 0 для остальных
+
+        Returns:
+            DataFrame с восстановленными типами
+        """
+        present_cols = set(df.columns)
+
+        # DateTime колонка (если ещё строками)
+        time_col = 'Дата и время события'
+        if time_col in present_cols and not pd.api.types.is_datetime64_any_dtype(df[time_col]):
+            df[time_col] = pd.to_datetime(df[time_col], utc=True, errors='coerce')
+
+        # Categorical и boolean колонки - одним astype по словарю типов
+        type_map = {col: 'category' for col in categorical_cols if col in present_cols}
+        if 'is_weekend' in present_cols:
+            type_map['is_weekend'] = 'bool'
+        df = df.astype(type_map, copy=False)
+
+        # Integer колонки независимы - приводим их параллельно в потоках и собираем одним assign
+        numeric_cols = [col for col in int_cols if col in present_cols]
+        if numeric_cols:
+            with ThreadPoolExecutor(max_workers=min(len(numeric_cols), os.cpu_count() or 1)) as executor:
+                converted = executor.map(
+                    lambda col: cls._coerce_int_column(df[col], col, int_cols[col]),
+                    numeric_cols
+                )
+                df = df.assign(**dict(zip(numeric_cols, converted)))
+
+        return df
+
+    @classmethod
+    def _read_merged_csv_chunked(cls, path: Path, categorical_cols: list, int_cols: Dict,
+                                 chunksize: int = 500_000) -> pd.DataFrame:
+        """
+        Чтение merged CSV парсером pandas по чанкам с типизацией каждого чанка
+
+        Пиковая память ограничена одним нетипизированным чанком, а не всем файлом.
+
+        Args:
+            path: путь к CSV
+            categorical_cols: колонки, читаемые сразу как category
+            int_cols: целевые int-типы
+            chunksize: строк в чанке
+
+        Returns:
+            DataFrame с восстановленными типами (кроме age_back и date)
+        """
+        present_cols = set(pd.read_csv(path, nrows=0).columns)
+        cat_cols = [col for col in categorical_cols if col in present_cols]
+
+        reader = pd.read_csv(
+            path,
+            dtype={col: 'category' for col in cat_cols},
+            chunksize=chunksize,
+            engine='c'
+        )
+        chunks = [cls._restore_merged_types(chunk, categorical_cols, int_cols) for chunk in reader]
 
-        # ============================================================
-        # FUNNEL FEATURES - КОЛОНКИ ФУНКЦИОНАЛЬНЫХ БЛОКОВ (68 колонок)
-        # ============================================================
-        # Префиксы всех 17 функциональных блоков
-        funnel_prefixes = [
-            'request',  # Создание заявки
-            'req_manage',  # Просмотр и управление заявками
-            'profile',  # Профиль
-            'nav',  # Навигация
-            'notif',  # Уведомления
-            'poll_oss',  # Опросы и собрания собственников
-            'rewards',  # Баллы и поощрения
-            'my_home',  # Мой дом
-            'partners',  # Услуги партнеров
-            'transport',  # Управление транспортом
-            'ann_view',  # Просмотр объявлений
-            'smart',  # Умные решения
-            'support',  # Техподдержка
-            'guest',  # Гостевой доступ
-            'city_serv',  # Городские сервисы
-            'address',  # Создание адреса
-            'ann_create'  # Создание объявления
-        ]
+        if not chunks:
+            return pd.read_csv(path, dtype={col: 'category' for col in cat_cols})
 
-        # Добавляем типы для funnel features
-        for prefix in funnel_prefixes:
-            int_cols[f'{prefix}_count'] = 'int16'  # Количество действий (0-1000)
-            int_cols[f'{prefix}_max_step'] = 'int8'  # Максимальный шаг (-1 до 50)
-            int_cols[f'{prefix}_success_count'] = 'int8'  # Успешные действия (0-50)
-            int_cols[f'{prefix}_review_count'] = 'int8'  # Review действия (0-50)
+        # У каждого чанка свой набор категорий - приводим к общему, иначе concat даст object
+        for col in cat_cols:
+            categories = sorted(set().union(*(chunk[col].cat.categories for chunk in chunks)))
+            for chunk in chunks:
+                chunk[col] = chunk[col].cat.set_categories(categories)
 
-        # Применяем типизацию
-        for col, dtype in int_cols.items():
-            if col in self.merged_df.columns:
-                try:
-                    logger.debug(f"Конвертация {col} в {dtype}")
-
-                    # Специальная обработка для max_step (может быть -1)
-                    if col.endswith('_max_step'):
-                        self.merged_df[col] = pd.to_numeric(
-                            self.merged_df[col],
-                            errors='coerce'
-                        ).fillna(-1).astype(dtype)
-                    else:
-                        self.merged_df[col] = pd.to_numeric(
-                            self.merged_df[col],
-                            errors='coerce'
-                        ).fillna(0).astype(dtype)
+        merged_df = pd.concat(chunks, ignore_index=True)
+        logger.info(f"Прочитано {len(chunks)} чанков, {len(merged_df):,} строк")
 
-                except Exception as e:
-                    logger.warning(f"Не удалось конвертировать {col} в {dtype}: {e}")
-                    # Fallback на более широкий тип
-                    if dtype == 'int8':
-                        fallback_dtype = 'int16'
-                    elif dtype == 'int16':
-                        fallback_dtype = 'int32'
-                    elif dtype == 'int32':
-                        fallback_dtype = 'int64'
-                    else:
-                        fallback_dtype = 'int64'
+        return merged_df
 
-                    logger.warning(f"Использую fallback тип {fallback_dtype}")
+    @classmethod
+    def _source_stat_key(cls, source_path: Path, schema: Dict) -> bytes:
+        """
+        Ключ актуальности кэша: размер и время изменения исходного файла, версия загрузчика
+        и хэш карты типов (изменение MERGED_INT_COLS, FUNNEL_PREFIXES и т.п. сбрасывает кэш)
+        """
+        stat = source_path.stat()
+        schema_hash = hashlib.sha1(
+            json.dumps(schema, sort_keys=True, ensure_ascii=False).encode()
+        ).hexdigest()[:16]
+        return f"{stat.st_size}:{stat.st_mtime_ns}:v{cls.FEATHER_CACHE_VERSION}:{schema_hash}".encode()
+
+    @classmethod
+    def _read_feather_cache(cls, source_path: Path, cache_path: Path, schema: Dict) -> Optional[pd.DataFrame]:
+        """
+        Чтение Feather-кэша, если он построен по текущей версии исходного файла и схемы типов
 
-                    if col.endswith('_max_step'):
-                        self.merged_df[col] = pd.to_numeric(
-                            self.merged_df[col],
-                            errors='coerce'
-                        ).fillna(-1).astype(fallback_dtype)
-                    else:
-                        self.merged_df[col] = pd.to_numeric(
-                            self.merged_df[col],
-                            errors='coerce'
-                        ).fillna(0).astype(fallback_dtype)
+        Args:
+            source_path: исходный CSV
+            cache_path: путь к Feather-кэшу
+            schema: карта типов, с которой строится кэш
 
-        # Nullable integer для age_back
-        if 'age_back' in self.merged_df.columns:
-            self.merged_df['age_back'] = pd.to_numeric(
-                self.merged_df['age_back'],
-                errors='coerce'
-            ).astype('Int16')
+        Returns:
+            DataFrame из кэша или None, если кэша нет или он устарел
+        """
+        if not cache_path.exists():
+            return None
 
-        # Конвертация date обратно в date (из string)
-        if 'date' in self.merged_df.columns:
-            self.merged_df['date'] = pd.to_datetime(
-                self.merged_df['date'],
-                errors='coerce'
-            ).dt.date
+        try:
+            table = feather.read_table(cache_path, memory_map=True)
+        except (pa.ArrowInvalid, OSError) as e:
+            logger.warning(f"Не удалось прочитать кэш {cache_path}: {e}")
+            return None
 
-        # ============================================================
-        # СТАТУС КОЛОНОК ОСНОВНОГО PIPELINE
-        # ============================================================
+        metadata = table.schema.metadata or {}
+        if metadata.get(cls.FEATHER_CACHE_KEY) != cls._source_stat_key(source_path, schema):
+            logger.info(f"Кэш {cache_path} устарел, CSV будет прочитан заново")
+            return None
 
-        pipeline_cols_status = {}
+        return table.to_pandas(self_destruct=True)
 
-        if 'global_session_id' in self.merged_df.columns:
-            unique_sessions = self.merged_df['global_session_id'].nunique()
-            pipeline_cols_status['global_session_id'] = f"✓ {unique_sessions:,} уникальных сессий"
-        else:
-            pipeline_cols_status['global_session_id'] = "✗ Не найден (выполните add_global_session_id)"
+    @classmethod
+    def _write_feather_cache(cls, df: pd.DataFrame, source_path: Path, cache_path: Path, schema: Dict) -> None:
+        """
+        Сохранение типизированного DataFrame в Feather (LZ4) с ключом исходного файла и схемы в метаданных
+        """
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[cls.FEATHER_CACHE_KEY] = cls._source_stat_key(source_path, schema)
 
-        if 'duration_seconds' in self.merged_df.columns:
-            avg_duration = self.merged_df['duration_seconds'].mean()
-            max_duration = self.merged_df['duration_seconds'].max()
-            pipeline_cols_status['duration_seconds'] = f"✓ Среднее: {avg_duration:.1f}с, Макс: {max_duration:,}с"
-        else:
-            pipeline_cols_status['duration_seconds'] = "✗ Не найден (выполните calculate_event_duration)"
+        try:
+            feather.write_feather(table.replace_schema_metadata(metadata), cache_path, compression='lz4')
+            logger.info(f"✓ Кэш сохранён: {cache_path}")
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить кэш {cache_path}: {e}")
 
-        if 'click_count' in self.merged_df.columns:
-            avg_tries = self.merged_df['click_count'].mean()
-            max_tries = self.merged_df['click_count'].max()
-            pipeline_cols_status['click_count'] = f"✓ Среднее: {avg_tries:.2f}, Макс: {max_tries}"
-        else:
-            pipeline_cols_status['click_count'] = "✗ Не найден (выполните remove_consecutive_duplicates_with_tries)"
+    @classmethod
+    def _consolidate_funnel_columns(cls, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Сборка int-колонок funnel features в один двумерный numpy-блок на каждый тип
 
-        if 'dbl_duration_seconds' in self.merged_df.columns:
-            avg_dbl_dur = self.merged_df['dbl_duration_seconds'].mean()
-            sum_dbl_dur = self.merged_df['dbl_duration_seconds'].sum()
-            pipeline_cols_status[
-                'dbl_duration_seconds'] = f"✓ Среднее: {avg_dbl_dur:.1f}с, Сумма: {sum_dbl_dur / 3600:.1f}ч"
-        else:
-            pipeline_cols_status[
-                'dbl_duration_seconds'] = "✗ Не найден (выполните remove_consecutive_duplicates_with_tries)"
+        После поколоночного чтения каждая из 68 колонок хранится отдельным массивом;
+        в общем блоке groupby и редукции по колонкам выполняются одним проходом.
 
-        if 'dbl_count' in self.merged_df.columns:
-            avg_dbl = self.merged_df['dbl_count'].mean()
-            max_dbl = self.merged_df['dbl_count'].max()
-            pipeline_cols_status['dbl_count'] = f"✓ Среднее: {avg_dbl:.2f}, Макс: {max_dbl}"
-        else:
-            pipeline_cols_status['dbl_count'] = "✗ Не найден (выполните remove_consecutive_duplicates_with_tries)"
+        Returns:
+            DataFrame с тем же порядком колонок
+        """
+        funnel_cols_by_dtype = {}
+        for col in df.columns:
+            if (any(col.startswith(f'{prefix}_') for prefix in cls.FUNNEL_PREFIXES)
+                    and isinstance(df[col].dtype, np.dtype) and df[col].dtype.kind in 'iu'):
+                funnel_cols_by_dtype.setdefault(df[col].dtype, []).append(col)
+
+        if not funnel_cols_by_dtype:
+            return df
+
+        # vstack даёт массив (колонки x строки), который pandas хранит в блоке без перекладки
+        blocks = [
+            pd.DataFrame(np.vstack([df[col].to_numpy() for col in cols]).T, columns=cols, index=df.index)
+            for cols in funnel_cols_by_dtype.values()
+        ]
+        funnel_cols = [col for cols in funnel_cols_by_dtype.values() for col in cols]
 
-        # ============================================================
-        # СТАТУС FUNNEL FEATURES КОЛОНОК
-        # ============================================================
+        consolidated = pd.concat([df.drop(columns=funnel_cols), *blocks], axis=1)
+        return consolidated[list(df.columns)]
 
-        # Проверяем наличие funnel features
-        funnel_cols_found = [col for col in self.merged_df.columns
-                             if any(col.startswith(f'{prefix}_') for prefix in funnel_prefixes)]
+    def load_merged_data_funnel(self, path: str = None, use_cache: bool = True) -> pd.DataFrame:
+        """
+        Загрузка ранее сохранённого merged_df из Parquet/CSV с правильной типизацией
+        Поддерживает колонки funnel features (68 колонок от FunnelFeaturesExtractor)
 
-        funnel_features_status = {}
+        Args:
+            path: путь к файлу Parquet или CSV (если None, используется
+                  data/processed/merged_data.parquet, а при его отсутствии merged_data.csv)
+            use_cache: для CSV использовать Feather-кэш рядом с файлом (merged_data.feather),
+                       пока размер и время изменения CSV не поменялись
 
-        if funnel_cols_found:
-            # Подсчитываем сколько колонок найдено для каждого блока
-            blocks_with_features = {}
-            for prefix in funnel_prefixes:
-                prefix_cols = [col for col in funnel_cols_found if col.startswith(f'{prefix}_')]
-                if prefix_cols:
-                    blocks_with_features[prefix] = len(prefix_cols)
+        Returns:
+            DataFrame с правильными типами
+        """
+        logger.info("Загрузка сохранённого merged_df...")
 
-            funnel_features_status['total_blocks'] = f"✓ {len(blocks_with_features)}/17 блоков"
-            funnel_features_status['total_columns'] = f"✓ {len(funnel_cols_found)}/68 колонок"
+        if path is None:
+            path = self._default_merged_path()
 
-            # Статистика по топ блокам
-            if blocks_with_features:
-                # Считаем количество сессий с взаимодействием для каждого блока
-                block_stats = []
-                for prefix in funnel_prefixes:
-                    count_col = f'{prefix}_count'
-                    if count_col in self.merged_df.columns:
-                        # Берем уникальные значения по сессиям
-                        sessions_with_block = (
-                                self.merged_df.groupby('global_session_id')[count_col]
-                                .first() > 0
-                        ).sum()
-
-                        if sessions_with_block > 0:
-                            total_actions = self.merged_df.groupby('global_session_id')[count_col].first().sum()
-                            block_stats.append({
-                                'prefix': prefix,
-                                'sessions': sessions_with_block,
-                                'actions': int(total_actions)
-                            })
-
-                # Сортируем по количеству сессий
-                block_stats.sort(key=lambda x: x['sessions'], reverse=True)
-        else:
-            funnel_features_status['status'] = (
-                "✗ Не найдено (выполните FunnelFeaturesExtractor.transform())"
+        path = Path(path)
+        if not path.exists():
+            raise FileNotFoundError(
+                f"Файл не найден: {path}\n"
+                f"Запустите полную обработку данных сначала."
             )
 
-        # ============================================================
-        # ВЫВОД СТАТУСОВ
-        # ============================================================
+        categorical_cols = self.MERGED_CATEGORICAL_COLS
+        funnel_prefixes = self.FUNNEL_PREFIXES
 
-        # Вывод статуса основных pipeline колонок
-        if any('✓' in status for status in pipeline_cols_status.values()):
-            logger.info(f"\n{'=' * 70}")
-            logger.info("СТАТУС КОЛОНОК ОСНОВНОГО PIPELINE:")
-            logger.info(f"{'=' * 70}")
-            for col_name, status in pipeline_cols_status.items():
-                logger.info(f"  {col_name}: {status}")
-            logger.info(f"{'=' * 70}")
+        # Integer колонки: основные + funnel features (68 колонок)
+        int_cols = dict(self.MERGED_INT_COLS)
+        for prefix in funnel_prefixes:
+            int_cols[f'{prefix}_count'] = 'int16'  # Количество действий (0-1000)
+            int_cols[f'{prefix}_max_step'] = 'int8'  # Максимальный шаг (-1 до 50)
+            int_cols[f'{prefix}_success_count'] = 'int8'  # Успешные действия (0-50)
+            int_cols[f'{prefix}_review_count'] = 'int8'  # Review действия (0-50)
 
-        # Вывод статуса funnel features
-        if funnel_features_status:
-            logger.info(f"\n{'=' * 70}")
-            logger.info("СТАТУС FUNNEL FEATURES (ФУНКЦИОНАЛЬНЫЕ БЛОКИ):")
-            logger.info(f"{'=' * 70}")
-            for key, status in funnel_features_status.items():
-                logger.info(f"  {key}: {status}")
+        # Типизированный кэш CSV: повторная загрузка без парсинга и восстановления типов
+        from_csv = path.suffix != '.parquet'
+        cache_path = path.with_suffix('.feather') if from_csv and use_cache else None
+        cache_schema = {'categorical': list(categorical_cols), 'int': int_cols}
+        cached_df = self._read_feather_cache(path, cache_path, cache_schema) if cache_path is not None else None
 
-            # Детальная информация по блокам
-            if funnel_cols_found and 'global_session_id' in self.merged_df.columns:
-                logger.info(f"\n  Детализация по блокам:")
+        if cached_df is not None:
+            self.merged_df = cached_df
+            logger.info(f"Загружено из кэша {cache_path}: {len(self.merged_df):,} строк, "
+                        f"{len(self.merged_df.columns)} колонок")
+        else:
+            # CSV читаем парсером Arrow сразу в нужные типы; Parquet хранит типы сам
+            logger.info(f"Чтение файла: {path}")
+            typed = False
+            if from_csv:
+                logger.warning(
+                    "Загрузка из CSV устарела и требует восстановления типов; "
+                    "используйте save_merged_data_parquet / load_merged_data_parquet"
+                )
+                # Polars - опционально, по флагу data.use_polars_io в конфиге
+                use_polars = self.config['data'].get('use_polars_io', False)
+                if use_polars and pl is None:
+                    logger.warning("use_polars_io включён, но polars не установлен - используется pyarrow")
+
+                if use_polars and pl is not None:
+                    logger.info("Чтение CSV через Polars...")
+                    self.merged_df = self._read_merged_csv_polars(path, categorical_cols, int_cols)
+                    typed = True
+                else:
+                    try:
+                        self.merged_df = self._read_merged_csv_arrow(path, categorical_cols, int_cols)
+                        typed = True
+                    except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+                        logger.warning(f"pyarrow не смог разобрать CSV ({e}), используется pandas.read_csv")
+                        self.merged_df = self._read_merged_csv_chunked(path, categorical_cols, int_cols)
+                        typed = True
+            else:
+                self.merged_df = pd.read_parquet(path)
 
-                # Группируем статистику
-                block_details = []
-                for prefix in funnel_prefixes:
-                    count_col = f'{prefix}_count'
-                    if count_col in self.merged_df.columns:
-                        sessions_data = self.merged_df.groupby('global_session_id')[count_col].first()
-                        sessions_with_block = (sessions_data > 0).sum()
-
-                        if sessions_with_block > 0:
-                            total_sessions = len(sessions_data)
-                            percentage = 100 * sessions_with_block / total_sessions
-                            total_actions = int(sessions_data.sum())
-                            avg_actions = sessions_data[sessions_data > 0].mean()
-
-                            block_details.append({
-                                'prefix': prefix,
-                                'sessions': sessions_with_block,
-                                'percent': percentage,
-                                'actions': total_actions,
-                                'avg': avg_actions
-                            })
+            logger.info(f"Загружено {len(self.merged_df):,} строк, {len(self.merged_df.columns)} колонок")
 
-                # Сортируем и показываем топ-5
-                block_details.sort(key=lambda x: x['sessions'], reverse=True)
-                for i, detail in enumerate(block_details[:5], 1):
-                    logger.info(
-                        f"    {i}. {detail['prefix']:12s}: "
-                        f"{detail['sessions']:6,} сессий ({detail['percent']:4.1f}%), "
-                        f"{detail['actions']:7,} действий, "
-                        f"среднее: {detail['avg']:.2f}"
-                    )
+            # Восстановление правильных типов данных
+            logger.info("Восстановление типов данных...")
 
-                if len(block_details) > 5:
-                    logger.info(f"    ... и ещё {len(block_details) - 5} блоков")
+            if not typed:
+                self.merged_df = self._restore_merged_types(self.merged_df, categorical_cols, int_cols)
 
-            logger.info(f"{'=' * 70}\n")
+            # Nullable integer для age_back
+            if 'age_back' in self.merged_df.columns:
+                self.merged_df['age_back'] = pd.to_numeric(
+                    self.merged_df['age_back'],
+                    errors='coerce'
+                ).astype('Int16')
 
-        # Проверка памяти
-        memory_usage = self.merged_df.memory_usage(deep=True).sum() / 1024 ** 2
-        logger.info(f"Использование памяти: {memory_usage:.2f} MB")
+            # date - полночь дня в datetime64[s] (Parquet возвращает [ms], CSV - строки)
+            if 'date' in self.merged_df.columns:
+                date_col = self.merged_df['date']
+                if from_csv:
+                    date_col = pd.to_datetime(date_col, errors='coerce')
+                self.merged_df['date'] = date_col.astype('datetime64[s]')
 
-        # Итоговая сводка
-        logger.info(f"\n{'=' * 70}")
-        logger.info("ИТОГОВАЯ СВОДКА ЗАГРУЖЕННОГО ДАТАСЕТА:")
-        logger.info(f"{'=' * 70}")
-        logger.info(f"  Строк: {len(self.merged_df):,}")
-        logger.info(f"  Колонок: {len(self.merged_df.columns)}")
-        logger.info(f"  Период: {self.merged_df['date'].min()} - {self.merged_df['date'].max()}")
-        logger.info(f"  Память: {memory_usage:.2f} MB")
+            self.merged_df = self._consolidate_funnel_columns(self.merged_df)
 
-        # Считаем сколько основных и funnel колонок
-        base_cols = len([c for c in self.merged_df.columns if not any(c.startswith(f'{p}_') for p in funnel_prefixes)])
-        funnel_cols_count = len(funnel_cols_found)
+            if cache_path is not None:
+                self._write_feather_cache(self.merged_df, path, cache_path, cache_schema)
 
-        logger.info(f"  Базовых колонок: {base_cols}")
-        if funnel_cols_count > 0:
-            logger.info(f"  Funnel features: {funnel_cols_count}")
-        logger.info(f"{'=' * 70}\n")
+        # Статусы и сводка нужны только для лога: при уровне выше INFO не считаем их вовсе
+        if logger.isEnabledFor(logging.INFO):
+            self._log_funnel_load_summary()
 
         logger.info("✓ Загрузка merged_df завершена успешно")
 
@@ -1102,39 +1808,111 @@ class DataPreprocessor:
         if self.merged_df is None or len(self.merged_df) == 0:
             raise ValueError("merged_df не загружен")
 
-        # Создание уникальных пар и присвоение ID
-        unique_sessions = self.merged_df[[
-            'Идентификатор устройства',
-            'Номер сессии в рамках устройства'
-        ]].drop_duplicates()
-
-        unique_sessions = unique_sessions.sort_values([
-            'Идентификатор устройства',
-            'Номер сессии в рамках устройства'
-        ]).reset_index(drop=True)
+        # ID сессии - номер пары (устройство, сессия) в отсортированном порядке, начиная с 1
+        device = self.merged_df['Идентификатор устройства'].to_numpy(np.int64)
+        session = self.merged_df['Номер сессии в рамках устройства'].to_numpy(np.int64)
 
-        unique_sessions['global_session_id'] = range(1, len(unique_sessions) + 1)
+        # Пара упаковывается в одно int64 с сохранением порядка, если номер сессии
+        # помещается в 32 бита без знака, а устройство - в int32
+        if (session.min() >= 0 and session.max() < 2 ** 32
+                and device.min() >= -2 ** 31 and device.max() < 2 ** 31):
+            codes = pd.factorize((device << 32) | session, sort=True)[0]
+        else:
+            codes = self.merged_df.groupby(
+                ['Идентификатор устройства', 'Номер сессии в рамках устройства'],
+                sort=True
+            ).ngroup().to_numpy()
 
-        # Присоединение к основной таблице
-        self.merged_df = self.merged_df.merge(
-            unique_sessions,
-            on=['Идентификатор устройства', 'Номер сессии в рамках устройства'],
-            how='left'
-        )
+        self.merged_df['global_session_id'] = (codes + 1).astype(np.int32)
 
         logger.info(f"Создано {self.merged_df['global_session_id'].nunique():,} уникальных global_session_id")
 
         # Сортировка
         logger.info("Сортировка данных...")
-        self.merged_df = self.merged_df.sort_values(
-            by=['global_session_id', 'Дата и время события'],
-            ascending=[True, True]
-        ).reset_index(drop=True)
+        self._sort_by_session()
 
         logger.info("✓ global_session_id добавлен и данные отсортированы")
 
         return self.merged_df
 
+    def _is_sorted_by_session(self) -> bool:
+        """
+        Проверка за один линейный проход, что merged_df уже упорядочен по SESSION_SORT_KEYS
+
+        Returns:
+            True, если стабильная сортировка не изменила бы порядок строк
+        """
+        session_col, time_col = self.SESSION_SORT_KEYS
+        times = self.merged_df[time_col]
+        # NaT сортировка переносит в конец сессии - такие данные просто сортируем
+        if not pd.api.types.is_datetime64_any_dtype(times.dtype) or times.isna().any():
+            return False
+
+        session_ids = self.merged_df[session_col].to_numpy()
+        if not (session_ids[1:] >= session_ids[:-1]).all():
+            return False
+
+        time_values = times.values
+        same_session = session_ids[1:] == session_ids[:-1]
+        return bool((time_values[1:][same_session] >= time_values[:-1][same_session]).all())
+
+    def _sort_by_session(self) -> None:
+        """
+        Стабильная сортировка merged_df по SESSION_SORT_KEYS с новым RangeIndex;
+        уже упорядоченные данные не пересортировываются
+        """
+        if self._is_sorted_by_session():
+            if not self.merged_df.index.equals(pd.RangeIndex(len(self.merged_df))):
+                self.merged_df = self.merged_df.reset_index(drop=True)
+            logger.debug("Данные уже упорядочены по сессии и времени - сортировка пропущена")
+        else:
+            session_col, time_col = self.SESSION_SORT_KEYS
+            session_ids = self.merged_df[session_col]
+            times = self.merged_df[time_col]
+            if (pd.api.types.is_integer_dtype(session_ids.dtype)
+                    and pd.api.types.is_datetime64_any_dtype(times.dtype)):
+                # Целочисленные ключи: один стабильный lexsort по int64 вместо sort_values по колонкам.
+                # NaT (минимальный int64) переносится в конец сессии, как при na_position='last'
+                time_keys = times.values.view('i8').copy()
+                time_keys[times.isna().to_numpy()] = np.iinfo(np.int64).max
+                order = np.lexsort((time_keys, session_ids.to_numpy()))
+                sorted_df = self.merged_df.take(order)
+                sorted_df.index = pd.RangeIndex(len(sorted_df))
+                self.merged_df = sorted_df
+            else:
+                self.merged_df = self.merged_df.sort_values(
+                    by=list(self.SESSION_SORT_KEYS),
+                    kind='stable',
+                    ignore_index=True
+                )
+        self._session_sorted_ref = weakref.ref(self.merged_df)
+
+    def _ensure_sorted_by_session(self) -> None:
+        """
+        Сортировка merged_df по global_session_id и времени, если он ещё не отсортирован
+
+        Шаги pipeline сохраняют порядок строк и отмечают результат как отсортированный,
+        поэтому повторная полная сортировка выполняется только для нового merged_df.
+        """
+        if self._session_sorted_ref is None or self._session_sorted_ref() is not self.merged_df:
+            self._sort_by_session()
+            logger.info("Данные отсортированы по global_session_id и времени")
+        else:
+            logger.debug("Данные уже отсортированы по global_session_id и времени")
+
+        if __debug__:
+            session_ids = self.merged_df['global_session_id'].to_numpy()
+            assert (session_ids[1:] >= session_ids[:-1]).all(), "merged_df не отсортирован по global_session_id"
+
+    def _ensure_comparison_categoricals(self):
+        """
+        Приведение колонок Экран/Функционал/Действие к category, если загрузчик этого не сделал:
+        сравнения, сдвиги и группировки дальше идут по целочисленным кодам
+        """
+        for col in COMPARISON_COLS:
+            if col in self.merged_df.columns and not isinstance(self.merged_df[col].dtype, pd.CategoricalDtype):
+                self.merged_df[col] = self.merged_df[col].astype('category')
+
     def calculate_event_duration(self) -> pd.DataFrame:
         """
         Расчёт длительности между событиями в рамках сессии
@@ -1185,12 +1963,7 @@ class DataPreprocessor:
         logger.info(f"Количество записей: {initial_rows:,}")
 
         # Убедимся что данные отсортированы
-        self.merged_df = self.merged_df.sort_values(
-            by=['global_session_id', time_col],
-            ascending=[True, True]
-        ).reset_index(drop=True)
-
-        logger.info("Данные отсортированы по global_session_id и времени")
+        self._ensure_sorted_by_session()
 
         # ============================================================
         # РАСЧЁТ ДЛИТЕЛЬНОСТИ (С ПОСЛЕДУЮЩЕЙ ЗАПИСЬЮ)
@@ -1198,27 +1971,19 @@ class DataPreprocessor:
 
         logger.info("Расчёт разницы во времени с последующим событием...")
 
-        # Добавляем колонку duration_seconds (по умолчанию 0)
-        self.merged_df['duration_seconds'] = 0
+        # Данные отсортированы по (global_session_id, время) - время последующей записи в сессии
+        # берётся сдвигом массива, без groupby и временной колонки next_time
+        event_time = self.merged_df[time_col].to_numpy(dtype='datetime64[ns]')
+        session_ids = self.merged_df['global_session_id'].to_numpy()
 
-        # Получаем время ПОСЛЕДУЮЩЕГО события В ТОЙ ЖЕ СЕССИИ
-        self.merged_df['next_time'] = self.merged_df.groupby(
-            'global_session_id',
-            sort=False
-        )[time_col].shift(-1)  # ← ИЗМЕНЕНО: shift(-1) вместо shift(1)
+        next_time = _shift_in_session(event_time, session_ids, -1, np.datetime64('NaT'))
 
-        # Вычисляем разницу во времени (timedelta)
-        time_diff = self.merged_df['next_time'] - self.merged_df[time_col]  # ← ИЗМЕНЕНО: next - current
+        # Последняя запись в сессии (и записи без времени): duration_seconds = 0
+        has_next = ~np.isnat(next_time) & ~np.isnat(event_time)
+        duration = np.zeros(len(event_time), dtype=np.int64)
+        duration[has_next] = (next_time[has_next] - event_time[has_next]) // np.timedelta64(1, 's')
 
-        # Конвертируем timedelta в секунды
-        # Для последних записей в сессии (где next_time = NaT) будет NaN, заменяем на 0
-        self.merged_df['duration_seconds'] = time_diff.dt.total_seconds().fillna(0)
-
-        # Конвертируем в целое число (int) для удобства
-        self.merged_df['duration_seconds'] = self.merged_df['duration_seconds'].astype('int32')
-
-        # Удаляем временную колонку
-        self.merged_df = self.merged_df.drop(columns=['next_time'])
+        self.merged_df['duration_seconds'] = duration.astype('int32')
 
         logger.info("✓ Длительности рассчитаны")
 
@@ -1231,68 +1996,61 @@ class DataPreprocessor:
         logger.info(f"{'=' * 60}")
 
         # Общая статистика
-        total_events = len(self.merged_df)
-        last_events = (self.merged_df['duration_seconds'] == 0).sum()
+        durations = self.merged_df['duration_seconds'].to_numpy()
+        total_events = len(durations)
+        last_events = (durations == 0).sum()
         non_last_events = total_events - last_events
 
         logger.info(f"Всего событий: {total_events:,}")
         logger.info(f"  - Последних событий в сессиях: {last_events:,} (duration=0)")
         logger.info(f"  - Промежуточных событий: {non_last_events:,}")
 
-        # Статистика по duration_seconds (исключая последние события)
-        non_zero_durations = self.merged_df[self.merged_df['duration_seconds'] > 0]['duration_seconds']
+        # Статистика по duration_seconds (исключая последние события) - по numpy-массиву без среза DataFrame
+        non_zero_durations = durations[durations > 0]
 
         if len(non_zero_durations) > 0:
+            mean_duration = non_zero_durations.mean()
+            median_duration = np.median(non_zero_durations)
+            max_duration = non_zero_durations.max()
+
             logger.info(f"\nСтатистика длительности (сек) для промежуточных событий:")
-            logger.info(f"  Среднее: {non_zero_durations.mean():.2f} сек ({non_zero_durations.mean() / 60:.2f} мин)")
-            logger.info(
-                f"  Медиана: {non_zero_durations.median():.0f} сек ({non_zero_durations.median() / 60:.2f} мин)")
+            logger.info(f"  Среднее: {mean_duration:.2f} сек ({mean_duration / 60:.2f} мин)")
+            logger.info(f"  Медиана: {median_duration:.0f} сек ({median_duration / 60:.2f} мин)")
             logger.info(f"  Мин: {non_zero_durations.min()} сек")
-            logger.info(f"  Макс: {non_zero_durations.max():,} сек ({non_zero_durations.max() / 3600:.2f} ч)")
-            logger.info(f"  Стд. откл.: {non_zero_durations.std():.2f} сек")
+            logger.info(f"  Макс: {max_duration:,} сек ({max_duration / 3600:.2f} ч)")
+            logger.info(f"  Стд. откл.: {non_zero_durations.std(ddof=1):.2f} сек")
 
-            # Перцентили
-            percentiles = non_zero_durations.quantile([0.25, 0.5, 0.75, 0.90, 0.95, 0.99])
+            # Перцентили - один проход
+            quantiles = [0.25, 0.5, 0.75, 0.90, 0.95, 0.99]
+            percentiles = np.quantile(non_zero_durations, quantiles)
             logger.info(f"\nПерцентили:")
-            logger.info(f"  25%: {percentiles[0.25]:.0f} сек")
-            logger.info(f"  50%: {percentiles[0.50]:.0f} сек")
-            logger.info(f"  75%: {percentiles[0.75]:.0f} сек")
-            logger.info(f"  90%: {percentiles[0.90]:.0f} сек")
-            logger.info(f"  95%: {percentiles[0.95]:.0f} сек")
-            logger.info(f"  99%: {percentiles[0.99]:.0f} сек")
-
-            # Распределение по интервалам
+            for q, value in zip(quantiles, percentiles):
+                logger.info(f"  {q * 100:.0f}%: {value:.0f} сек")
+
+            # Распределение по интервалам (a, b], как в pd.cut
             bins = [0, 1, 5, 10, 30, 60, 300, 600, 1800, 3600, float('inf')]
             labels = ['0-1с', '1-5с', '5-10с', '10-30с', '30с-1м', '1-5м', '5-10м', '10-30м', '30м-1ч', '>1ч']
 
-            self.merged_df['duration_bin'] = pd.cut(
-                self.merged_df['duration_seconds'],
-                bins=bins,
-                labels=labels,
-                include_lowest=True
-            )
-
-            duration_dist = self.merged_df[self.merged_df['duration_seconds'] > 0][
-                'duration_bin'].value_counts().sort_index()
-
-            logger.info(f"\nРаспределение длительности:")
-            for interval, count in duration_dist.items():
-                percentage = count / non_last_events * 100
-                logger.info(f"  {interval}: {count:,} ({percentage:.1f}%)")
+            # Распределение нужно только для лога
+            if logger.isEnabledFor(logging.INFO):
+                bin_idx = np.searchsorted(bins, non_zero_durations, side='left') - 1
+                duration_dist = np.bincount(bin_idx, minlength=len(labels))
 
-            # Удаляем временную колонку
-            self.merged_df = self.merged_df.drop(columns=['duration_bin'])
+                logger.info(f"\nРаспределение длительности:")
+                for interval, count in zip(labels, duration_dist):
+                    percentage = count / non_last_events * 100
+                    logger.info(f"  {interval}: {count:,} ({percentage:.1f}%)")
 
             # Аномально долгие паузы (>30 минут)
-            long_pauses = (self.merged_df['duration_seconds'] > 1800).sum()
+            long_pause_mask = durations > 1800
+            long_pauses = long_pause_mask.sum()
             if long_pauses > 0:
                 long_pauses_pct = long_pauses / total_events * 100
                 logger.info(f"\n⚠️  Событий с длительностью >30 минут: {long_pauses:,} ({long_pauses_pct:.2f}%)")
                 logger.info(f"    (пользователь долго оставался на экране или вышел из приложения)")
 
                 # Примеры долгих пауз
-                long_pause_examples = self.merged_df[self.merged_df['duration_seconds'] > 1800].nlargest(5,
-                                                                                                         'duration_seconds')
+                long_pause_examples = self.merged_df[long_pause_mask].nlargest(5, 'duration_seconds')
                 logger.info(f"\n    Топ-5 самых долгих задержек на экранах:")
                 for idx, row in long_pause_examples.iterrows():
                     duration_hours = row['duration_seconds'] / 3600
@@ -1309,7 +2067,7 @@ class DataPreprocessor:
             'last_events': int(last_events),
             'non_last_events': int(non_last_events),
             'avg_duration_sec': float(non_zero_durations.mean()) if len(non_zero_durations) > 0 else 0,
-            'median_duration_sec': float(non_zero_durations.median()) if len(non_zero_durations) > 0 else 0,
+            'median_duration_sec': float(np.median(non_zero_durations)) if len(non_zero_durations) > 0 else 0,
             'max_duration_sec': int(non_zero_durations.max()) if len(non_zero_durations) > 0 else 0,
             'long_pauses_count': int(long_pauses) if 'long_pauses' in locals() else 0
         }
@@ -1376,8 +2134,7 @@ class DataPreprocessor:
             self.merged_df['duration_seconds'] = 0
 
         # ВАЖНО: Сравниваем только по 3 колонкам
-        comparison_cols = ['Экран', 'Функционал', 'Действие']
-        time_col = 'Дата и время события'
+        comparison_cols = list(COMPARISON_COLS)
         action_col = 'Действие'
 
         logger.info(f"Сравнение дубликатов только по колонкам: {comparison_cols}")
@@ -1387,45 +2144,32 @@ class DataPreprocessor:
             if col not in self.merged_df.columns:
                 raise ValueError(f"Колонка '{col}' не найдена в данных")
 
-        # Убедимся что данные отсортированы
-        self.merged_df = self.merged_df.sort_values(
-            by=['global_session_id', time_col],
-            ascending=[True, True]
-        ).reset_index(drop=True)
-
-        logger.info("Данные отсортированы по global_session_id и времени")
+        # Убедимся что данные отсортированы, а колонки сравнения - категориальные
+        self._ensure_sorted_by_session()
+        self._ensure_comparison_categoricals()
 
         # ============================================================
         # ВЕКТОРИЗОВАННЫЙ ПОДХОД
         # ============================================================
 
-        logger.info("Создание ключа для группировки дубликатов...")
-
-        # Создаём составной ключ из 3 колонок для сравнения
-        key_parts = []
-        for col in comparison_cols:
-            col_str = self.merged_df[col].astype(str).fillna('__NA__')
-            key_parts.append(col_str)
-
-        # Объединяем в один ключ
-        self.merged_df['comparison_key'] = (
-                key_parts[0] + '|' + key_parts[1] + '|' + key_parts[2]
-        )
+        session_ids = self.merged_df['global_session_id'].to_numpy()
 
         logger.info("Поиск последовательных дубликатов...")
 
-        # Получаем ключ предыдущей записи В ТОЙ ЖЕ СЕССИИ
-        self.merged_df['prev_key'] = self.merged_df.groupby(
-            'global_session_id',
-            sort=False
-        )['comparison_key'].shift(1)
-
-        # Проверяем, является ли текущая запись дубликатом предыдущей
-        self.merged_df['is_duplicate'] = (
-                self.merged_df['comparison_key'] == self.merged_df['prev_key']
-        ).fillna(False)
+        # Новая группа начинается когда меняется сессия ИЛИ хотя бы одна из 3 колонок
+        # отличается от предыдущей записи; сравниваются коды категорий (NaN = -1), без строк
+        new_group = np.empty(len(session_ids), dtype=bool)
+        new_group[0] = True
+        new_group[1:] = session_ids[1:] != session_ids[:-1]
+        for col in comparison_cols:
+            if isinstance(self.merged_df[col].dtype, pd.CategoricalDtype):
+                codes = self.merged_df[col].cat.codes.to_numpy()
+            else:
+                codes = pd.factorize(self.merged_df[col])[0]
+            new_group[1:] |= codes[1:] != codes[:-1]
 
-        duplicates_count = self.merged_df['is_duplicate'].sum()
+        # Дубликат - запись с теми же значениями 3 колонок, что и предыдущая в той же сессии
+        duplicates_count = len(new_group) - int(new_group.sum())
         logger.info(f"Найдено последовательных дубликатов: {duplicates_count:,}")
 
         # ============================================================
@@ -1434,14 +2178,8 @@ class DataPreprocessor:
 
         logger.info("Группировка последовательных дубликатов...")
 
-        # Создаём новую группу когда меняется сессия ИЛИ текущая запись НЕ дубликат
-        self.merged_df['new_group'] = (
-                (~self.merged_df['is_duplicate']) |
-                (self.merged_df['global_session_id'] != self.merged_df['global_session_id'].shift(1))
-        )
-
-        # Присваиваем ID группам
-        self.merged_df['group_id'] = self.merged_df['new_group'].cumsum()
+        # Присваиваем ID группам (int32 - вдвое уже ключ для последующих groupby)
+        self.merged_df['group_id'] = new_group.cumsum(dtype=np.int32)
 
         # ============================================================
         # ПОДСЧЁТ МЕТРИК ДЛЯ КАЖДОЙ ГРУППЫ
@@ -1450,31 +2188,22 @@ class DataPreprocessor:
         logger.info("Подсчёт кликов и суммирование длительности...")
 
         # Создаём флаг: является ли Действие значимым (не "Не указано")
-        self.merged_df['is_meaningful_action'] = (
-                self.merged_df[action_col] != 'Не указано'
+        self.merged_df['is_meaningful_action'] = ~_equals_value(self.merged_df[action_col], 'Не указано')
+
+        # Агрегаты групп транслируются на строки через transform - без промежуточной таблицы и map
+        group_gb = self.merged_df.groupby('group_id', sort=False)
+        # Размер группы
+        self.merged_df['group_size'] = group_gb['global_session_id'].transform('size').astype(np.int32)
+        self.merged_df['meaningful_actions_count'] = (
+            group_gb['is_meaningful_action'].transform('sum').astype(np.int32)
         )
+        self.merged_df['total_duration'] = group_gb['duration_seconds'].transform('sum')  # Сумма длительностей
 
-        # Агрегация по группам
-        group_stats = self.merged_df.groupby('group_id').agg({
-            'is_duplicate': 'first',
-            'global_session_id': 'count',  # Размер группы
-            'is_meaningful_action': 'sum',  # Количество значимых действий
-            'duration_seconds': 'sum'  # Сумма длительностей
-        }).rename(columns={
-            'global_session_id': 'group_size',
-            'is_meaningful_action': 'meaningful_actions_count',
-            'duration_seconds': 'total_duration'
-        })
-
-        # Маппинг статистики обратно в основной DataFrame
-        self.merged_df['group_size'] = self.merged_df['group_id'].map(group_stats['group_size'])
-        self.merged_df['meaningful_actions_count'] = self.merged_df['group_id'].map(
-            group_stats['meaningful_actions_count'])
-        self.merged_df['total_duration'] = self.merged_df['group_id'].map(group_stats['total_duration'])
-
-        # Помечаем последнюю запись в каждой группе
-        self.merged_df['rank_in_group'] = self.merged_df.groupby('group_id').cumcount(ascending=False)
-        self.merged_df['is_last_in_group'] = (self.merged_df['rank_in_group'] == 0)
+        # Помечаем последнюю запись в каждой группе: группы идут подряд,
+        # поэтому запись последняя, если следующая начинает новую группу (сдвиг new_group без groupby)
+        is_last_in_group = np.ones(len(new_group), dtype=bool)
+        is_last_in_group[:-1] = new_group[1:]
+        self.merged_df['is_last_in_group'] = is_last_in_group
 
         # ============================================================
         # ЗАПОЛНЕНИЕ ПОЛЕЙ ДЛЯ ПОСЛЕДНЕЙ ЗАПИСИ В ГРУППЕ
@@ -1482,41 +2211,32 @@ class DataPreprocessor:
 
         logger.info("Заполнение click_count, duration_seconds, dbl_duration_seconds, dbl_count...")
 
-        last_in_group_mask = self.merged_df['is_last_in_group']
+        # Позиции последних записей групп вычисляются один раз; колонки заполняются через numpy-массивы
+        last_pos = np.flatnonzero(is_last_in_group)
+        total_duration = self.merged_df['total_duration'].to_numpy()
+        durations = self.merged_df['duration_seconds'].to_numpy(copy=True)
 
         # click_count = количество значимых действий в группе (минимум 1)
-        self.merged_df.loc[last_in_group_mask, 'click_count'] = self.merged_df.loc[
-            last_in_group_mask,
-            'meaningful_actions_count'
-        ].clip(lower=1)
-
-        # duration_seconds = сумма всех длительностей в группе
-        self.merged_df.loc[last_in_group_mask, 'duration_seconds'] = self.merged_df.loc[
-            last_in_group_mask,
-            'total_duration'
-        ]
+        click_count = self.merged_df['click_count'].to_numpy(copy=True)
+        click_count[last_pos] = np.maximum(self.merged_df['meaningful_actions_count'].to_numpy()[last_pos], 1)
 
         # ← НОВАЯ ЛОГИКА: dbl_duration_seconds и dbl_count
-        # Для каждой группы вычисляем сумму duration_seconds удалённых записей
-        # Удалённые = все кроме последней = group_size - 1
-
-        # Создаём маску для удаляемых записей в каждой группе
-        self.merged_df['is_removed'] = ~self.merged_df['is_last_in_group']
+        # Удалённые = все записи группы кроме последней, поэтому сумма их duration_seconds
+        # равна сумме по группе минус длительность последней записи (до её перезаписи ниже)
+        dbl_duration = self.merged_df['dbl_duration_seconds'].to_numpy(copy=True)
+        dbl_duration[last_pos] = total_duration[last_pos] - durations[last_pos]
 
-        # Для каждой группы суммируем duration_seconds удалённых записей
-        removed_duration_by_group = self.merged_df[self.merged_df['is_removed']].groupby('group_id')[
-            'duration_seconds'].sum()
-
-        # Для последней записи в группе записываем эту сумму
-        self.merged_df.loc[last_in_group_mask, 'dbl_duration_seconds'] = self.merged_df.loc[
-            last_in_group_mask,
-            'group_id'
-        ].map(removed_duration_by_group).fillna(0).astype('int32')
+        # duration_seconds = сумма всех длительностей в группе
+        durations[last_pos] = total_duration[last_pos]
 
         # dbl_count = количество удалённых = group_size - 1
-        self.merged_df.loc[last_in_group_mask, 'dbl_count'] = (
-                self.merged_df.loc[last_in_group_mask, 'group_size'] - 1
-        )
+        dbl_count = self.merged_df['dbl_count'].to_numpy(copy=True)
+        dbl_count[last_pos] = self.merged_df['group_size'].to_numpy()[last_pos] - 1
+
+        self.merged_df['click_count'] = click_count
+        self.merged_df['dbl_duration_seconds'] = dbl_duration
+        self.merged_df['duration_seconds'] = durations
+        self.merged_df['dbl_count'] = dbl_count
 
         # ============================================================
         # УДАЛЕНИЕ ДУБЛИКАТОВ
@@ -1527,21 +2247,21 @@ class DataPreprocessor:
 
         logger.info(f"Записей для удаления: {rows_to_remove_count:,}")
 
-        # Фильтрация
-        self.merged_df = self.merged_df[rows_to_keep].copy()
-
-        # Удаление временных колонок
+        # Удаление временных колонок до фильтрации, чтобы не копировать их в отфильтрованный фрейм
+        rows_to_keep = rows_to_keep.to_numpy()
         temp_cols = [
-            'comparison_key', 'prev_key', 'is_duplicate',
-            'new_group', 'group_id', 'group_size',
-            'rank_in_group', 'is_last_in_group',
-            'is_meaningful_action', 'meaningful_actions_count', 'total_duration',
-            'is_removed'
+            'group_id', 'group_size',
+            'is_last_in_group',
+            'is_meaningful_action', 'meaningful_actions_count', 'total_duration'
         ]
-        self.merged_df = self.merged_df.drop(columns=temp_cols)
+        self.merged_df.drop(columns=temp_cols, inplace=True)
+
+        # Фильтрация (результат - новый фрейм, отдельный .copy() не нужен)
+        self.merged_df = self.merged_df.loc[rows_to_keep]
 
-        # Сброс индекса
-        self.merged_df = self.merged_df.reset_index(drop=True)
+        # Сброс индекса (фильтрация сохраняет порядок строк)
+        self.merged_df.reset_index(drop=True, inplace=True)
+        self._session_sorted_ref = weakref.ref(self.merged_df)
 
         # ============================================================
         # СТАТИСТИКА
@@ -1558,49 +2278,59 @@ class DataPreprocessor:
         logger.info(f"Удалено дубликатов: {removed_rows:,} ({removal_percentage:.2f}%)")
         logger.info(f"Осталось записей: {final_rows:,}")
 
+        # Агрегаты каждой колонки считаются один раз по numpy-массиву и переиспользуются в логе и stats
+        dbl_counts = self.merged_df['dbl_count'].to_numpy()
+        dbl_durations = self.merged_df['dbl_duration_seconds'].to_numpy()
+        click_counts = self.merged_df['click_count'].to_numpy()
+        durations = self.merged_df['duration_seconds'].to_numpy()
+
+        avg_dbl_count = dbl_counts.mean()
+        avg_dbl_duration = dbl_durations.mean()
+        sum_dbl_duration = dbl_durations.sum()
+
         # Статистика по новым полям
         logger.info(f"\nСтатистика dbl_count (количество удалённых дублей):")
-        logger.info(f"  Среднее: {self.merged_df['dbl_count'].mean():.2f}")
-        logger.info(f"  Медиана: {self.merged_df['dbl_count'].median():.0f}")
-        logger.info(f"  Макс: {self.merged_df['dbl_count'].max()}")
+        logger.info(f"  Среднее: {avg_dbl_count:.2f}")
+        logger.info(f"  Медиана: {np.median(dbl_counts):.0f}")
+        logger.info(f"  Макс: {dbl_counts.max()}")
 
         logger.info(f"\nСтатистика dbl_duration_seconds (длительность удалённых):")
-        logger.info(f"  Среднее: {self.merged_df['dbl_duration_seconds'].mean():.2f} сек")
-        logger.info(f"  Медиана: {self.merged_df['dbl_duration_seconds'].median():.0f} сек")
-        logger.info(f"  Макс: {self.merged_df['dbl_duration_seconds'].max():,} сек")
-        logger.info(
-            f"  Сумма: {self.merged_df['dbl_duration_seconds'].sum():,} сек ({self.merged_df['dbl_duration_seconds'].sum() / 3600:.2f} ч)")
+        logger.info(f"  Среднее: {avg_dbl_duration:.2f} сек")
+        logger.info(f"  Медиана: {np.median(dbl_durations):.0f} сек")
+        logger.info(f"  Макс: {dbl_durations.max():,} сек")
+        logger.info(f"  Сумма: {sum_dbl_duration:,} сек ({sum_dbl_duration / 3600:.2f} ч)")
 
         # Распределение dbl_count
-        dbl_count_dist = self.merged_df['dbl_count'].value_counts().sort_index()
+        # np.unique возвращает значения уже отсортированными - без Index и отдельной сортировки
+        dbl_count_values, dbl_count_freqs = np.unique(dbl_counts, return_counts=True)
         logger.info(f"\nРаспределение dbl_count:")
-        for count, freq in dbl_count_dist.head(10).items():
+        for count, freq in zip(dbl_count_values[:10].tolist(), dbl_count_freqs[:10].tolist()):
             percentage = freq / final_rows * 100
             logger.info(f"  {count} удалённых: {freq:,} ({percentage:.2f}%)")
 
         # Статистика по click_count
-        click_count_dist = self.merged_df['click_count'].value_counts().sort_index()
+        click_count_values, click_count_freqs = np.unique(click_counts, return_counts=True)
         logger.info(f"\nРаспределение click_count:")
-        for tries, count in click_count_dist.head(15).items():
+        for tries, count in zip(click_count_values[:15].tolist(), click_count_freqs[:15].tolist()):
             percentage = count / final_rows * 100
             logger.info(f"  {tries} {'клик' if tries == 1 else 'кликов'}: {count:,} ({percentage:.2f}%)")
 
-        if len(click_count_dist) > 15:
-            logger.info(f"  ... (всего уникальных значений: {len(click_count_dist)})")
+        if len(click_count_values) > 15:
+            logger.info(f"  ... (всего уникальных значений: {len(click_count_values)})")
 
         # Максимальное количество кликов
-        max_tries = self.merged_df['click_count'].max()
+        max_tries = click_counts.max()
         logger.info(f"\nМаксимальное количество кликов: {max_tries}")
 
         # Средний click_count
-        avg_tries = self.merged_df['click_count'].mean()
+        avg_tries = click_counts.mean()
         logger.info(f"Средний click_count: {avg_tries:.2f}")
 
         # Статистика по duration_seconds
         logger.info(f"\nСтатистика duration_seconds:")
-        logger.info(f"  Среднее: {self.merged_df['duration_seconds'].mean():.2f} сек")
-        logger.info(f"  Медиана: {self.merged_df['duration_seconds'].median():.0f} сек")
-        logger.info(f"  Макс: {self.merged_df['duration_seconds'].max():,} сек")
+        logger.info(f"  Среднее: {durations.mean():.2f} сек")
+        logger.info(f"  Медиана: {np.median(durations):.0f} сек")
+        logger.info(f"  Макс: {durations.max():,} сек")
 
         logger.info(f"{'=' * 60}\n")
 
@@ -1612,9 +2342,9 @@ class DataPreprocessor:
             'removal_percentage': float(removal_percentage),
             'max_tries': int(max_tries),
             'avg_tries': float(avg_tries),
-            'avg_dbl_count': float(self.merged_df['dbl_count'].mean()),
-            'avg_dbl_duration': float(self.merged_df['dbl_duration_seconds'].mean()),
-            'click_count_distribution': {int(k): int(v) for k, v in click_count_dist.head(20).items()}
+            'avg_dbl_count': float(avg_dbl_count),
+            'avg_dbl_duration': float(avg_dbl_duration),
+            'click_count_distribution': dict(zip(click_count_values[:20].tolist(), click_count_freqs[:20].tolist()))
         }
 
         logger.info("✓ Дедупликация завершена успешно")
@@ -1668,16 +2398,13 @@ class DataPreprocessor:
         initial_rows = len(self.merged_df)
         logger.info(f"Исходное количество записей: {initial_rows:,}")
 
-        time_col = 'Дата и время события'
         screen_col = 'Экран'
         action_col = 'Действие'
         not_specified = 'Не указано'
 
-        # Убедимся что данные отсортированы
-        self.merged_df = self.merged_df.sort_values(
-            by=['global_session_id', time_col],
-            ascending=[True, True]
-        ).reset_index(drop=True)
+        # Убедимся что данные отсортированы, а колонки сравнения - категориальные
+        self._ensure_sorted_by_session()
+        self._ensure_comparison_categoricals()
 
         logger.info(f"Удаление записей с Действие='{not_specified}' на одном экране...")
 
@@ -1685,18 +2412,18 @@ class DataPreprocessor:
         # ГРУППИРОВКА ПО ПОСЛЕДОВАТЕЛЬНОСТЯМ ОДНОГО ЭКРАНА
         # ============================================================
 
-        # Создаём новую группу когда меняется экран или сессия
-        self.merged_df['prev_screen'] = self.merged_df.groupby(
-            'global_session_id',
-            sort=False
-        )[screen_col].shift(1)
+        # Создаём новую группу когда меняется экран или сессия.
+        # Сравниваем коды экранов; NaN (код -1) не равен ничему, как и при сравнении значений
+        if isinstance(self.merged_df[screen_col].dtype, pd.CategoricalDtype):
+            screen_codes = self.merged_df[screen_col].cat.codes.to_numpy(np.int64)
+        else:
+            screen_codes = pd.factorize(self.merged_df[screen_col])[0].astype(np.int64)
+        session_ids = self.merged_df['global_session_id'].to_numpy()
 
-        self.merged_df['screen_changed'] = (
-                (self.merged_df[screen_col] != self.merged_df['prev_screen']) |
-                (self.merged_df['global_session_id'] != self.merged_df['global_session_id'].shift(1))
-        )
+        prev_screen_codes = _shift_in_session(screen_codes, session_ids, 1, -1)
+        screen_changed = (screen_codes != prev_screen_codes) | (screen_codes < 0)
 
-        self.merged_df['screen_group_id'] = self.merged_df['screen_changed'].cumsum()
+        self.merged_df['screen_group_id'] = screen_changed.cumsum(dtype=np.int32)
 
         # ============================================================
         # ОБРАБОТКА КАЖДОЙ ГРУППЫ ЭКРАНА
@@ -1704,45 +2431,15 @@ class DataPreprocessor:
 
         logger.info("Обработка последовательностей одного экрана...")
 
-        # Маркируем записи на удаление
-        self.merged_df['to_remove'] = False
-
-        # Для каждой группы экрана
-        for group_id, group_df in self.merged_df.groupby('screen_group_id', sort=False):
-            group_indices = group_df.index.tolist()
-
-            if len(group_indices) < 2:
-                # Только одна запись - ничего не делаем
-                continue
-
-            # Находим записи с "Не указано" и без
-            not_specified_mask = group_df[action_col] == not_specified
-            not_specified_indices = group_df[not_specified_mask].index.tolist()
-            meaningful_indices = group_df[~not_specified_mask].index.tolist()
-
-            if len(not_specified_indices) == 0:
-                # Нет записей с "Не указано" - ничего не делаем
-                continue
-
-            if len(meaningful_indices) == 0:
-                # Все записи с "Не указано" - оставляем как есть
-                continue
-
-            # ============================================================
-            # ЛОГИКА СХЛОПЫВАНИЯ
-            # ============================================================
-
-            # Суммируем duration_seconds из записей с "Не указано"
-            sum_not_specified_duration = self.merged_df.loc[not_specified_indices, 'duration_seconds'].sum()
-
-            # Находим первую значимую запись (где Действие != "Не указано")
-            first_meaningful_idx = meaningful_indices[0]
+        is_not_specified = _equals_value(self.merged_df[action_col], not_specified)
 
-            # Добавляем накопленную длительность к первой значимой записи
-            self.merged_df.loc[first_meaningful_idx, 'duration_seconds'] += sum_not_specified_duration
-
-            # Помечаем записи с "Не указано" на удаление
-            self.merged_df.loc[not_specified_indices, 'to_remove'] = True
+        # Один проход JIT-ядра по отсортированным группам без groupby; без numba - векторный вариант
+        collapse = _collapse_kernel if _collapse_kernel is not None else _collapse_vectorized
+        durations = self.merged_df['duration_seconds'].to_numpy(copy=True)
+        keep = np.empty(len(durations), dtype=np.bool_)
+        collapse(self.merged_df['screen_group_id'].to_numpy(), is_not_specified, durations, keep)
+        self.merged_df['duration_seconds'] = durations
+        self.merged_df['to_remove'] = ~keep
 
         # ============================================================
         # УДАЛЕНИЕ ЗАПИСЕЙ
@@ -1751,14 +2448,16 @@ class DataPreprocessor:
         rows_to_remove_count = self.merged_df['to_remove'].sum()
         logger.info(f"Записей для удаления (Действие='{not_specified}'): {rows_to_remove_count:,}")
 
-        # Фильтрация
-        self.merged_df = self.merged_df[~self.merged_df['to_remove']].copy()
+        # Удаление временных колонок до фильтрации, чтобы не копировать их в отфильтрованный фрейм
+        rows_to_keep = ~self.merged_df['to_remove'].to_numpy()
+        self.merged_df.drop(columns=['screen_group_id', 'to_remove'], inplace=True)
 
-        # Удаление временных колонок
-        self.merged_df = self.merged_df.drop(columns=['prev_screen', 'screen_changed', 'screen_group_id', 'to_remove'])
+        # Фильтрация (результат - новый фрейм, отдельный .copy() не нужен)
+        self.merged_df = self.merged_df.loc[rows_to_keep]
 
-        # Сброс индекса
-        self.merged_df = self.merged_df.reset_index(drop=True)
+        # Сброс индекса (фильтрация сохраняет порядок строк)
+        self.merged_df.reset_index(drop=True, inplace=True)
+        self._session_sorted_ref = weakref.ref(self.merged_df)
 
         # ============================================================
         # СТАТИСТИКА
@@ -1776,20 +2475,23 @@ class DataPreprocessor:
         logger.info(f"Осталось записей: {final_rows:,}")
 
         # Сколько "Не указано" осталось
-        remaining_not_specified = (self.merged_df[action_col] == not_specified).sum()
+        remaining_not_specified = int(_equals_value(self.merged_df[action_col], not_specified).sum())
         remaining_not_specified_pct = (remaining_not_specified / final_rows * 100) if final_rows > 0 else 0
         logger.info(
             f"\nОставшихся записей с Действие='{not_specified}': {remaining_not_specified:,} ({remaining_not_specified_pct:.2f}%)")
         logger.info(f"(это записи, где на экране не было других действий)")
 
-        # Статистика по duration_seconds
+        # Статистика по duration_seconds - каждый агрегат один раз по numpy-массиву
+        durations = self.merged_df['duration_seconds'].to_numpy()
+        avg_duration = durations.mean()
+        max_duration = durations.max()
+        sum_duration = durations.sum()
+
         logger.info(f"\nСтатистика duration_seconds после схлопывания:")
-        logger.info(f"  Среднее: {self.merged_df['duration_seconds'].mean():.2f} сек")
-        logger.info(f"  Медиана: {self.merged_df['duration_seconds'].median():.0f} сек")
-        logger.info(
-            f"  Макс: {self.merged_df['duration_seconds'].max():,} сек ({self.merged_df['duration_seconds'].max() / 3600:.2f} ч)")
-        logger.info(
-            f"  Сумма: {self.merged_df['duration_seconds'].sum():,} сек ({self.merged_df['duration_seconds'].sum() / 3600:.2f} ч)")
+        logger.info(f"  Среднее: {avg_duration:.2f} сек")
+        logger.info(f"  Медиана: {np.median(durations):.0f} сек")
+        logger.info(f"  Макс: {max_duration:,} сек ({max_duration / 3600:.2f} ч)")
+        logger.info(f"  Сумма: {sum_duration:,} сек ({sum_duration / 3600:.2f} ч)")
 
         # Топ-10 экранов по среднему duration_seconds
         avg_duration_by_screen = self.merged_df.groupby(screen_col, observed=True)['duration_seconds'].mean().sort_values(
@@ -1808,7 +2510,7 @@ class DataPreprocessor:
             'final_rows': int(final_rows),
             'removal_percentage': float(removal_percentage),
             'remaining_not_specified': int(remaining_not_specified),
-            'avg_duration_sec': float(self.merged_df['duration_seconds'].mean())
+            'avg_duration_sec': float(avg_duration)
         }
 
         logger.info("✓ Схлопывание записей завершено успешно")
@@ -1844,7 +2546,7 @@ class DataPreprocessor:
             output_path.parent.mkdir(parents=True, exist_ok=True)
 
         # Колонки для анализа
-        target_columns = ['Экран', 'Функционал', 'Действие']
+        target_columns = list(COMPARISON_COLS)
 
         # Проверка наличия колонок
         for col in target_columns:
@@ -1871,20 +2573,21 @@ class DataPreprocessor:
             'unique_values': {}
         }
 
-        for col in target_columns:
-            logger.info(f"Обработка колонки '{col}'...")
+        # Частоты колонок независимы - считаем их параллельно в потоках
+        # (value_counts по кодам категорий выполняется в C и отпускает GIL)
+        with ThreadPoolExecutor(max_workers=min(len(target_columns), os.cpu_count() or 1)) as executor:
+            column_value_counts = list(executor.map(lambda col: self.merged_df[col].value_counts(), target_columns))
 
-            # Подсчёт частот
-            value_counts = self.merged_df[col].value_counts()
+        for col, value_counts in zip(target_columns, column_value_counts):
+            logger.info(f"Обработка колонки '{col}'...")
 
             # Формирование списка с частотами
-            values_with_frequency = []
-            for value, count in value_counts.items():
-                values_with_frequency.append({
-                    'value': str(value),
-                    'count': int(count),
-                    'percentage': round(count / len(self.merged_df) * 100, 2)
-                })
+            values_with_frequency = pd.DataFrame({
+                'value': value_counts.index.astype(str),
+                'count': value_counts.to_numpy(),
+                # round() Python (не numpy .round): отчёт совпадает на значениях ровно посередине
+                'percentage': [round(p, 2) for p in (value_counts.to_numpy() / len(self.merged_df) * 100).tolist()]
+            }).to_dict('records')
 
             # Статистика
             total_unique = len(values_with_frequency)
@@ -1904,8 +2607,9 @@ class DataPreprocessor:
         # Топ-10 комбинаций (Экран + Функционал + Действие)
         logger.info("Подсчёт топ-10 комбинаций...")
 
-        combinations = self.merged_df.groupby(target_columns).size().reset_index(name='count')
-        combinations = combinations.sort_values('count', ascending=False).head(10)
+        # observed=True - только встречающиеся комбинации, без декартова произведения категорий
+        combinations = self.merged_df.groupby(target_columns, observed=True).size().reset_index(name='count')
+        combinations = combinations.sort_values('count', ascending=False, kind='stable').head(10)
 
         top_combinations = []
         for _, row in combinations.iterrows():
@@ -1925,8 +2629,7 @@ class DataPreprocessor:
 
         logger.info(f"Сохранение в файл: {output_path}")
 
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(result, f, ensure_ascii=False, indent=2)
+        _write_json(output_path, result)
 
         file_size = output_path.stat().st_size / 1024
         logger.info(f"✓ Файл сохранён: {output_path} ({file_size:.2f} KB)")
@@ -1988,7 +2691,7 @@ class DataPreprocessor:
             output_path.parent.mkdir(parents=True, exist_ok=True)
 
         # Колонки для анализа
-        target_columns = ['Экран', 'Функционал', 'Действие']
+        target_columns = list(COMPARISON_COLS)
         separator = ' => '
 
         # Проверка наличия колонок
@@ -2004,15 +2707,38 @@ class DataPreprocessor:
 
         logger.info("Создание комбинированных строк...")
 
-        # Создаём единую строку для каждой комбинации
-        self.merged_df['_combination'] = (
-                self.merged_df['Экран'].astype(str) + separator +
-                self.merged_df['Функционал'].astype(str) + separator +
-                self.merged_df['Действие'].astype(str)
-        )
-
-        # Подсчёт частот
-        combination_counts = self.merged_df['_combination'].value_counts()
+        # Комбинация кодируется одним int64-ключом из кодов категорий (смешанная система счисления),
+        # строки собираются только для уникальных комбинаций. NaN (код -1) даёт 'nan', как astype(str)
+        combination_key = np.zeros(len(self.merged_df), dtype=np.int64)
+        column_labels = []
+        for col in target_columns:
+            if isinstance(self.merged_df[col].dtype, pd.CategoricalDtype):
+                codes = self.merged_df[col].cat.codes.to_numpy(np.int64)
+                uniques = self.merged_df[col].cat.categories
+            else:
+                # Без категорий подписи берутся из astype(str), чтобы None/NaN выглядели как раньше
+                codes, uniques = pd.factorize(self.merged_df[col].astype(str))
+                codes = codes.astype(np.int64)
+            # Последний элемент - подпись для кода -1
+            labels = np.array([str(value) for value in uniques] + ['nan'], dtype=object)
+            combination_key = combination_key * len(labels) + (codes + 1)
+            column_labels.append(labels)
+
+        # Подсчёт частот по ключам - тот же порядок, что у value_counts по строкам
+        key_counts = pd.Series(combination_key).value_counts()
+
+        # Декодирование ключей обратно в коды колонок и сборка строк
+        remaining = key_counts.index.to_numpy(np.int64)
+        decoded_labels = []
+        for labels in reversed(column_labels):
+            remaining, codes = np.divmod(remaining, len(labels))
+            decoded_labels.append(labels[codes - 1])
+        decoded_labels.reverse()
+
+        combination_paths = decoded_labels[0]
+        for labels in decoded_labels[1:]:
+            combination_paths = combination_paths + separator + labels
+        combination_counts = pd.Series(key_counts.to_numpy(), index=combination_paths)
 
         logger.info(f"Найдено уникальных комбинаций: {len(combination_counts):,}")
 
@@ -2022,13 +2748,12 @@ class DataPreprocessor:
 
         total_records = len(self.merged_df)
 
-        combinations_list = []
-        for combination, count in combination_counts.items():
-            combinations_list.append({
-                'path': str(combination),
-                'count': int(count),
-                'percentage': round(count / total_records * 100, 4)
-            })
+        combinations_list = pd.DataFrame({
+            'path': combination_counts.index,
+            'count': combination_counts.to_numpy(),
+            # round() Python (не numpy .round): отчёт совпадает на значениях ровно посередине
+            'percentage': [round(p, 4) for p in (combination_counts.to_numpy() / total_records * 100).tolist()]
+        }).to_dict('records')
 
         # Метаданные
         result = {
@@ -2048,9 +2773,6 @@ class DataPreprocessor:
             'combinations': combinations_list
         }
 
-        # Удаляем временную колонку
-        self.merged_df = self.merged_df.drop(columns=['_combination'])
-
         # ============================================================
         # ДОПОЛНИТЕЛЬНАЯ СТАТИСТИКА
         # ============================================================
@@ -2075,8 +2797,7 @@ class DataPreprocessor:
 
         logger.info(f"Сохранение в файл: {output_path}")
 
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(result, f, ensure_ascii=False, indent=2)
+        _write_json(output_path, result)
 
         file_size = output_path.stat().st_size / 1024
         logger.info(f"✓ Файл сохранён: {output_path} ({file_size:.2f} KB)")
@@ -2160,7 +2881,6 @@ class DataPreprocessor:
         initial_rows = len(self.merged_df)
         logger.info(f"Исходное количество записей: {initial_rows:,}")
 
-        time_col = 'Дата и время события'
         screen_col = 'Экран'
         function_col = 'Функционал'
         action_col = 'Действие'
@@ -2175,13 +2895,9 @@ class DataPreprocessor:
             if col not in self.merged_df.columns:
                 raise ValueError(f"Колонка '{col}' не найдена в данных")
 
-        # Убедимся что данные отсортированы
-        self.merged_df = self.merged_df.sort_values(
-            by=['global_session_id', time_col],
-            ascending=[True, True]
-        ).reset_index(drop=True)
-
-        logger.info("Данные отсортированы по global_session_id и времени")
+        # Убедимся что данные отсортированы, а колонки сравнения - категориальные
+        self._ensure_sorted_by_session()
+        self._ensure_comparison_categoricals()
 
         # ============================================================
         # ПОИСК ПОСЛЕДНИХ ЗАПИСЕЙ С УСЛОВИЕМ
@@ -2192,48 +2908,53 @@ class DataPreprocessor:
         logger.info(f"  Функционал = '{target_function}'")
         logger.info(f"  Действие = '{target_action}'")
 
-        # Помечаем последнюю запись в каждой сессии
-        self.merged_df['is_last_in_session'] = False
-        last_indices = self.merged_df.groupby('global_session_id', sort=False).tail(1).index
-        self.merged_df.loc[last_indices, 'is_last_in_session'] = True
-
-        # Проверяем условие для последних записей
-        self.merged_df['to_remove'] = (
-                self.merged_df['is_last_in_session'] &
-                (self.merged_df[screen_col] == target_screen) &
-                (self.merged_df[function_col] == target_function) &
-                (self.merged_df[action_col] == target_action)
-        )
+        # Помечаем последнюю запись в каждой сессии: данные отсортированы,
+        # поэтому это записи перед сменой global_session_id (и последняя строка).
+        # Маски остаются локальными массивами - без временных колонок в merged_df
+        session_ids = self.merged_df['global_session_id'].to_numpy()
+        is_last_in_session = np.ones(len(session_ids), dtype=bool)
+        is_last_in_session[:-1] = session_ids[1:] != session_ids[:-1]
 
-        rows_to_remove_count = self.merged_df['to_remove'].sum()
+        # Проверяем условие только для последних записей: кандидаты - позиции последних записей,
+        # каждое следующее сравнение идет лишь по оставшимся кандидатам, а не по всему фрейму
+        last_positions = np.flatnonzero(is_last_in_session)
+        candidates = last_positions
+        for col, target_value in ((screen_col, target_screen),
+                                  (function_col, target_function),
+                                  (action_col, target_action)):
+            candidates = candidates[_equals_value(self.merged_df[col].take(candidates), target_value)]
+
+        to_remove = np.zeros(len(session_ids), dtype=bool)
+        to_remove[candidates] = True
+
+        rows_to_remove_count = len(candidates)
 
         logger.info(f"Найдено записей для удаления: {rows_to_remove_count:,}")
 
         if rows_to_remove_count == 0:
             logger.info("⚠️  Записей для удаления не найдено")
-            self.merged_df = self.merged_df.drop(columns=['is_last_in_session', 'to_remove'])
             return self.merged_df
 
         # ============================================================
         # СТАТИСТИКА ДО УДАЛЕНИЯ
         # ============================================================
 
-        # Получаем информацию об удаляемых записях
-        records_to_remove = self.merged_df[self.merged_df['to_remove']].copy()
+        # Сессии идут подряд: длины сессий - расстояния между их последними записями,
+        # а затронутые сессии - те, чья последняя запись удаляется (без isin по всему фрейму)
+        session_lengths = np.diff(last_positions, prepend=-1)
+        session_affected = to_remove[last_positions]
+        affected_sessions_count = int(session_affected.sum())
 
         # Средняя длина сессии с таким окончанием
-        sessions_with_removal = records_to_remove['global_session_id'].unique()
-        session_lengths = self.merged_df[
-            self.merged_df['global_session_id'].isin(sessions_with_removal)
-        ].groupby('global_session_id').size()
+        avg_session_length = session_lengths[session_affected].mean()
 
-        avg_session_length = session_lengths.mean()
-
-        # Какие ещё экраны были в этих сессиях
-        other_screens_in_affected_sessions = self.merged_df[
-            (self.merged_df['global_session_id'].isin(sessions_with_removal)) &
-            (~self.merged_df['to_remove'])
-            ][screen_col].value_counts().head(5)
+        # Какие ещё экраны были в этих сессиях - нужно только для лога
+        other_screens_in_affected_sessions = None
+        if logger.isEnabledFor(logging.INFO):
+            in_affected_sessions = np.repeat(session_affected, session_lengths)
+            other_screens_in_affected_sessions = self.merged_df.loc[
+                in_affected_sessions & ~to_remove, screen_col
+            ].value_counts().head(5)
 
         # ============================================================
         # УДАЛЕНИЕ ЗАПИСЕЙ
@@ -2241,14 +2962,12 @@ class DataPreprocessor:
 
         logger.info("Удаление записей...")
 
-        # Фильтрация
-        self.merged_df = self.merged_df[~self.merged_df['to_remove']].copy()
-
-        # Удаление временных колонок
-        self.merged_df = self.merged_df.drop(columns=['is_last_in_session', 'to_remove'])
+        # Фильтрация (результат - новый фрейм, отдельный .copy() не нужен)
+        self.merged_df = self.merged_df.loc[~to_remove]
 
-        # Сброс индекса
-        self.merged_df = self.merged_df.reset_index(drop=True)
+        # Сброс индекса (фильтрация сохраняет порядок строк)
+        self.merged_df.reset_index(drop=True, inplace=True)
+        self._session_sorted_ref = weakref.ref(self.merged_df)
 
         # ============================================================
         # СТАТИСТИКА ПОСЛЕ УДАЛЕНИЯ
@@ -2258,9 +2977,12 @@ class DataPreprocessor:
         removed_rows = initial_rows - final_rows
         removal_percentage = (removed_rows / initial_rows * 100) if initial_rows > 0 else 0
 
+        # Длины оставшихся сессий: из каждой затронутой удалена ровно одна запись
+        session_lengths_after = session_lengths - session_affected
+        session_lengths_after = session_lengths_after[session_lengths_after > 0]
+
         # Количество затронутых сессий
-        affected_sessions_count = len(sessions_with_removal)
-        total_sessions = self.merged_df['global_session_id'].nunique()
+        total_sessions = len(session_lengths_after)
         affected_sessions_pct = (affected_sessions_count / (
                     total_sessions + affected_sessions_count) * 100) if total_sessions > 0 else 0
 
@@ -2279,15 +3001,14 @@ class DataPreprocessor:
         logger.info(f"  Это означает что пользователь открыл меню 'Еще' и вышел из приложения")
         logger.info(f"  Такие записи не несут полезной информации и были удалены")
 
-        if len(other_screens_in_affected_sessions) > 0:
+        if other_screens_in_affected_sessions is not None and len(other_screens_in_affected_sessions) > 0:
             logger.info(f"\nТоп-5 экранов в затронутых сессиях (до 'Еще'):")
             for screen, count in other_screens_in_affected_sessions.items():
                 percentage = count / other_screens_in_affected_sessions.sum() * 100
                 logger.info(f"  {screen}: {count:,} ({percentage:.1f}%)")
 
         # Проверка на "пустые" сессии (если после удаления осталась только 1 запись)
-        session_lengths_after = self.merged_df.groupby('global_session_id').size()
-        single_event_sessions = (session_lengths_after == 1).sum()
+        single_event_sessions = int((session_lengths_after == 1).sum())
 
         if single_event_sessions > 0:
             single_event_pct = single_event_sessions / total_sessions * 100
@@ -2346,41 +3067,108 @@ class DataPreprocessor:
         initial_rows = len(self.merged_df)
         logger.info(f"Исходное количество записей: {initial_rows:,}")
 
+        # Колонки сравнения - категориальные: маски ниже сравнивают коды, а не строки
+        self._ensure_comparison_categoricals()
+
         # ============================================================
         # ИСПРАВЛЕНИЕ ОПЕЧАТОК
         # ============================================================
 
-        corrections = [
-            # В Действие
-            (action_col, "выбор тега 1", "Выбор тега 1"),
-            (action_col, "Тап на услугу партнёров", "Тап на услугу партнеров"),
-            (action_col, "'Тап на кнопку 'Мои'", "Тап на кнопку 'Мои'"),
-            # В Функционал
-            (function_col, "Выбор услуги партнёров", "Выбор услуги партнеров"),
-            # В Функционал с условием на Действие
-            (function_col, "Переход к предоставлению доступа через +", None,
-             action_col, "Тап на кнопку", "Тап на кнопку '+'"),
-            (function_col, "Отмена отзыва доступа", None,
-             action_col, "Тап на кнопку 'Отмена'", "Тап на кнопку 'Отменить'"),
+        # Простые замены значений: по одной таблице перекодировки категорий на колонку
+        value_corrections = {
+            action_col: {
+                "выбор тега 1": "Выбор тега 1",
+                "Тап на услугу партнёров": "Тап на услугу партнеров",
+                "'Тап на кнопку 'Мои'": "Тап на кнопку 'Мои'",
+            },
+            function_col: {
+                "Выбор услуги партнёров": "Выбор услуги партнеров",
+            },
+        }
+        # Замены Действия с условием на Функционал: (Функционал, старое Действие, новое Действие)
+        conditional_corrections = [
+            ("Переход к предоставлению доступа через +", "Тап на кнопку", "Тап на кнопку '+'"),
+            ("Отмена отзыва доступа", "Тап на кнопку 'Отмена'", "Тап на кнопку 'Отменить'"),
         ]
+
+        # Коды и тип категорий колонок извлекаются один раз; все исправления идут по numpy-массивам
+        # кодов, в DataFrame каждая измененная колонка записывается один раз в конце
+        codes_by_col = {col: self.merged_df[col].cat.codes.to_numpy().copy() for col in (action_col, function_col)}
+        dtype_by_col = {col: self.merged_df[col].dtype for col in (action_col, function_col)}
+        changed_cols = set()
+
+        def add_categories(col, values):
+            # Новые значения дописываются в конец категорий, существующие коды не меняются
+            dtype = dtype_by_col[col]
+            missing = [value for value in dict.fromkeys(values) if value not in dtype.categories]
+            if missing:
+                dtype_by_col[col] = pd.CategoricalDtype(dtype.categories.append(pd.Index(missing)),
+                                                        ordered=dtype.ordered)
+            return dtype_by_col[col].categories
+
         total_corrections = 0
-        for correction in corrections:
-            if len(correction) == 3:
-                col, old_value, new_value = correction
-                mask = self.merged_df[col] == old_value
-            elif len(correction) == 6:
-                col, target_function, _, action_col_cond, old_action, new_action = correction
-                mask = (self.merged_df[col] == target_function) & (self.merged_df[action_col_cond] == old_action)
+        for col, mapping in value_corrections.items():
+            codes = codes_by_col[col]
+            categories = dtype_by_col[col].categories
+            # Частоты всех категорий за один проход - число исправлений по каждому правилу
+            category_counts = np.bincount(codes[codes >= 0], minlength=len(categories))
+
+            applied = {}
+            for old_value, new_value in mapping.items():
+                count_corrections = int(category_counts[categories.get_loc(old_value)]) if old_value in categories else 0
+                if count_corrections > 0:
+                    applied[old_value] = new_value
+                    total_corrections += count_corrections
+                    logger.info(
+                        f"Исправлено {count_corrections:,} записей в колонке '{col}': '{old_value}' → '{new_value}'")
+                else:
+                    logger.info(f"Записей для исправления в колонке '{col}' с значением '{old_value}' не найдено")
+
+            if applied:
+                # Старые коды перекодируются одним проходом по таблице перекодировки
+                categories = add_categories(col, applied.values())
+                code_map = np.arange(len(categories), dtype=codes.dtype)
+                for old_value, new_value in applied.items():
+                    code_map[categories.get_loc(old_value)] = categories.get_loc(new_value)
+                codes_by_col[col] = np.where(codes >= 0, code_map[codes], codes)
+                changed_cols.add(col)
+
+        # Условные замены: маски по кодам уже исправленных колонок
+        function_codes = codes_by_col[function_col]
+        action_codes = codes_by_col[action_col]
+        condition_masks = []
+        for target_function, old_action, new_action in conditional_corrections:
+            function_categories = dtype_by_col[function_col].categories
+            action_categories = dtype_by_col[action_col].categories
+            if target_function in function_categories and old_action in action_categories:
+                mask = ((function_codes == function_categories.get_loc(target_function))
+                        & (action_codes == action_categories.get_loc(old_action)))
+                count_corrections = int(mask.sum())
             else:
-                continue
-
-            count_corrections = mask.sum()
+                count_corrections = 0
             if count_corrections > 0:
-                self.merged_df.loc[mask, col] = new_value
+                condition_masks.append((mask, new_action))
                 total_corrections += count_corrections
-                logger.info(f"Исправлено {count_corrections:,} записей в колонке '{col}': '{old_value}' → '{new_value}'")
+                logger.info(
+                    f"Исправлено {count_corrections:,} записей в колонке '{action_col}' "
+                    f"(Функционал '{target_function}'): '{old_action}' → '{new_action}'")
             else:
-                logger.info(f"Записей для исправления в колонке '{col}' с значением '{old_value}' не найдено")
+                logger.info(
+                    f"Записей для исправления в колонке '{action_col}' с значением '{old_action}' "
+                    f"(Функционал '{target_function}') не найдено")
+
+        if condition_masks:
+            categories = add_categories(action_col, [new_action for _, new_action in condition_masks])
+            new_codes = action_codes.copy()
+            for mask, new_action in condition_masks:
+                new_codes[mask] = categories.get_loc(new_action)
+            codes_by_col[action_col] = new_codes
+            changed_cols.add(action_col)
+
+        # Запись измененных колонок обратно в DataFrame
+        for col in changed_cols:
+            self.merged_df[col] = pd.Categorical.from_codes(codes_by_col[col], dtype=dtype_by_col[col])
+
         if total_corrections == 0:
             logger.info("⚠️  Не найдено записей для исправления опечаток")
         else:
@@ -2426,11 +3214,14 @@ class DataPreprocessor:
 
         Все строки одного пользователя получают одинаковые значения флагов.
 
+        Колонки добавляются в переданный DataFrame на месте (без полной копии);
+        возвращается тот же объект.
+
         Args:
             df: DataFrame с колонками 'Дата и время события' и 'Идентификатор устройства'
 
         Returns:
-            DataFrame с добавленными колонками is_lost, is_stay, is_new
+            Тот же DataFrame с добавленными колонками is_lost, is_stay, is_new
 
         Raises:
             ValueError: если отсутствуют необходимые колонки
@@ -2461,8 +3252,9 @@ class DataPreprocessor:
         logger.info(f"Исходный датасет: {len(df):,} строк")
         logger.info(f"Уникальных пользователей: {df['Идентификатор устройства'].nunique():,}")
 
-        # Создаем копию для работы
-        result_df = df.copy()
+        # Работаем с исходным DataFrame: добавляются только колонки флагов,
+        # полная копия всех колонок не нужна
+        result_df = df
 
         # Преобразуем в datetime если нужно
         if not pd.api.types.is_datetime64_any_dtype(result_df['Дата и время события']):
@@ -2473,86 +3265,49 @@ class DataPreprocessor:
                 errors='coerce'
             )
 
-        # Извлекаем месяц
+        # Извлекаем месяц (локальный массив, во фрейм не добавляется): целочисленно из
+        # datetime64[M] - число месяцев от эпохи, без разбора полей даты через .dt.month
         logger.info("Определение месяцев активности пользователей...")
-        result_df['_temp_month'] = result_df['Дата и время события'].dt.month
-
-        # Для каждого пользователя определяем в каких месяцах он был активен
-        user_months = result_df.groupby('Идентификатор устройства')['_temp_month'].apply(
-            lambda x: set(x.dropna().unique())
-        ).to_dict()
+        event_times = result_df['Дата и время события']
+        if event_times.dt.tz is not None and str(event_times.dt.tz) != 'UTC':
+            # Месяц считается по локальному времени зоны, как у .dt.month
+            event_times = event_times.dt.tz_localize(None)
+        months = (event_times.values.astype('datetime64[M]').view('i8') % 12 + 1).astype(np.int8)
+        months[event_times.isna().to_numpy()] = 0  # NaT не относится ни к одному месяцу
+
+        # Для каждого пользователя определяем, был ли он активен в сентябре и в октябре:
+        # пользователи кодируются factorize, активность по месяцам считается bincount по кодам
+        user_codes, user_ids = pd.factorize(result_df['Идентификатор устройства'])
+        has_september = np.bincount(user_codes[(months == 9) & (user_codes >= 0)], minlength=len(user_ids)) > 0
+        has_october = np.bincount(user_codes[(months == 10) & (user_codes >= 0)], minlength=len(user_ids)) > 0
 
         logger.info("Классификация пользователей по когортам...")
 
-        # Определяем статус для каждого пользователя
-        user_status = {}
+        # Статус пользователя кодируется одним uint8: 0 - прочие, 1 - lost, 2 - stay, 3 - new.
+        # Последний элемент - для кода -1 (пустой ID), он остается "прочим"
+        user_status = np.zeros(len(user_ids) + 1, dtype=np.uint8)
+        user_status[:-1][has_september & ~has_october] = 1  # Был в сентябре, нет в октябре
+        user_status[:-1][has_september & has_october] = 2  # Был в сентябре и октябре
+        user_status[:-1][~has_september & has_october] = 3  # Только в октябре
 
+        status_counts = np.bincount(user_status[:-1], minlength=4)
         stats = {
-            'lost': 0,  # Был в сентябре, нет в октябре
-            'stay': 0,  # Был в сентябре и октябре
-            'new': 0,  # Только в октябре
-            'other': 0  # Другие случаи (например, только в августе)
+            'other': int(status_counts[0]),  # Другие случаи (например, только в августе)
+            'lost': int(status_counts[1]),
+            'stay': int(status_counts[2]),
+            'new': int(status_counts[3])
         }
 
-        for user_id, months in user_months.items():
-            has_september = 9 in months
-            has_october = 10 in months
-
-            # Определяем статус
-            if has_september and not has_october:
-                # Потерянный пользователь
-                user_status[user_id] = {
-                    'is_lost': True,
-                    'is_stay': False,
-                    'is_new': False
-                }
-                stats['lost'] += 1
-
-            elif has_september and has_october:
-                # Удержанный пользователь
-                user_status[user_id] = {
-                    'is_lost': False,
-                    'is_stay': True,
-                    'is_new': False
-                }
-                stats['stay'] += 1
-
-            elif not has_september and has_october:
-                # Новый пользователь
-                user_status[user_id] = {
-                    'is_lost': False,
-                    'is_stay': False,
-                    'is_new': True
-                }
-                stats['new'] += 1
-
-            else:
-                # Другие случаи (не был ни в сентябре, ни в октябре)
-                user_status[user_id] = {
-                    'is_lost': False,
-                    'is_stay': False,
-                    'is_new': False
-                }
-                stats['other'] += 1
-
-        # Применяем статусы ко всем строкам пользователя
+        # Применяем статусы ко всем строкам пользователя: один gather кодов по строкам,
+        # булевы флаги получаются сравнением с кодом статуса
         logger.info("Применение статусов к датасету...")
 
-        result_df['is_lost'] = result_df['Идентификатор устройства'].map(
-            lambda x: user_status.get(x, {}).get('is_lost', False)
-        )
-        result_df['is_stay'] = result_df['Идентификатор устройства'].map(
-            lambda x: user_status.get(x, {}).get('is_stay', False)
-        )
-        result_df['is_new'] = result_df['Идентификатор устройства'].map(
-            lambda x: user_status.get(x, {}).get('is_new', False)
-        )
-
-        # Удаляем временную колонку
-        result_df.drop('_temp_month', axis=1, inplace=True)
+        row_status = user_status[user_codes]
+        for status_code, status_col in enumerate(['is_lost', 'is_stay', 'is_new'], start=1):
+            result_df[status_col] = row_status == status_code
 
         # Статистика
-        total_users = len(user_status)
+        total_users = len(user_ids)
 
         logger.info("\n" + "=" * 70)
         logger.info("СТАТИСТИКА ПО КОГОРТАМ:")
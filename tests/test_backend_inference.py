@@ -0,0 +1,213 @@
+# Запуск: pytest tests/test_backend_inference.py
+
+import copy
+import sys
+from pathlib import Path
+
+import pytest
+
+# Без torch / torch_geometric модуль пропускается, а не ломает сбор тестов
+torch = pytest.importorskip("torch")
+pytest.importorskip("torch_geometric")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from mlmodel import (
+    GraphSAGEChurn,
+    build_new_node_subgraph,
+    collate_subgraphs,
+    fold_input_scaler,
+    quantize_regressor,
+    to_adj_t,
+)
+
+GRAPH_SAVE_DIR = Path(__file__).resolve().parent.parent / "data" / "graph-save"
+CHECKPOINT_PATH = GRAPH_SAVE_DIR / "gnn_model.pth"
+EDGE_INDEX_PATH = GRAPH_SAVE_DIR / "edge_index.pt"
+
+NUM_NODES = 200
+NUM_EDGES = 600
+IN_CHANNELS = 16
+
+
+@pytest.fixture(scope="module")
+def graph():
+    gen = torch.Generator().manual_seed(0)
+    x = torch.randn(NUM_NODES, IN_CHANNELS, generator=gen)
+    src = torch.randint(0, NUM_NODES, (NUM_EDGES,), generator=gen)
+    dst = torch.randint(0, NUM_NODES, (NUM_EDGES,), generator=gen)
+    edge_index = torch.stack([torch.cat([src, dst]), torch.cat([dst, src])])
+    return x, edge_index
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    m = GraphSAGEChurn(in_channels=IN_CHANNELS, hidden_channels=32, num_layers=2)
+    m.eval()
+    return m
+
+
+def full_graph_predict(model, x_base, edge_index_base, existing_node_idx, x_new):
+    new_node_idx = x_base.size(0)
+    new_edges = torch.tensor(
+        [
+            [existing_node_idx, new_node_idx],
+            [new_node_idx, existing_node_idx],
+        ],
+        dtype=torch.long,
+    ).t()
+    x_all = torch.cat([x_base, x_new], dim=0)
+    edge_index = torch.cat([edge_index_base, new_edges], dim=1)
+    with torch.no_grad():
+        return model(x_all, edge_index)[new_node_idx]
+
+
+class TestIncrementalInference:
+    """Инференс по подграфу должен совпадать с прогоном по всему графу"""
+
+    @pytest.mark.parametrize("existing_node_idx", [0, 17, NUM_NODES - 1])
+    def test_subgraph_matches_full_graph(self, graph, model, existing_node_idx):
+        x_base, edge_index_base = graph
+        x_new = torch.randn(1, IN_CHANNELS)
+
+        expected = full_graph_predict(model, x_base, edge_index_base, existing_node_idx, x_new)
+
+        x_sub, edge_index_sub, new_local_idx = build_new_node_subgraph(
+            x_base, edge_index_base, existing_node_idx, x_new, num_hops=len(model.convs)
+        )
+        with torch.no_grad():
+            actual = model(x_sub, edge_index_sub)[new_local_idx]
+
+        assert torch.allclose(actual, expected, atol=1e-5)
+
+    def test_batched_subgraphs_match_single(self, graph, model):
+        """Новые ноды в одном батче не влияют друг на друга, даже с общей точкой присоединения"""
+        x_base, edge_index_base = graph
+        anchors = [3, 3, 42]
+        x_news = [torch.randn(1, IN_CHANNELS) for _ in anchors]
+
+        subgraphs = [
+            build_new_node_subgraph(x_base, edge_index_base, anchor, x_new, num_hops=len(model.convs))
+            for anchor, x_new in zip(anchors, x_news)
+        ]
+        x, edge_index, new_node_idx = collate_subgraphs(subgraphs)
+        with torch.no_grad():
+            batched = model(x, edge_index)[new_node_idx]
+
+        for i, (anchor, x_new) in enumerate(zip(anchors, x_news)):
+            expected = full_graph_predict(model, x_base, edge_index_base, anchor, x_new)
+            assert torch.allclose(batched[i], expected, atol=1e-5)
+
+    def test_csr_adjacency_matches_edge_index(self, graph, model):
+        """SpMM по CSR-матрице смежности даёт тот же результат, что и scatter по рёбрам"""
+        x, edge_index = graph
+
+        with torch.no_grad():
+            expected = model(x, edge_index)
+            actual = model(x, to_adj_t(edge_index, x.size(0)))
+
+        assert torch.allclose(actual, expected, atol=1e-5)
+
+    def test_int32_edge_index_matches_int64(self, graph, model):
+        """Подграф и CSR на int32 индексах дают тот же результат, что и на int64"""
+        x_base, edge_index_base = graph
+        x_new = torch.randn(1, IN_CHANNELS)
+        existing_node_idx = 11
+
+        expected = full_graph_predict(model, x_base, edge_index_base, existing_node_idx, x_new)
+
+        x_sub, edge_index_sub, new_local_idx = build_new_node_subgraph(
+            x_base, edge_index_base.to(torch.int32), existing_node_idx, x_new, num_hops=len(model.convs)
+        )
+        assert edge_index_sub.dtype == torch.int32
+
+        with torch.no_grad():
+            actual = model(x_sub, to_adj_t(edge_index_sub, x_sub.size(0)))[new_local_idx]
+
+        assert torch.allclose(actual, expected, atol=1e-5)
+
+
+class TestQuantizedHead:
+    """int8-голова должна давать те же предсказания в пределах допуска"""
+
+    def test_quantized_regressor_close_to_fp32(self, graph, model):
+        x, edge_index = graph
+        quantized = quantize_regressor(copy.deepcopy(model))
+
+        with torch.no_grad():
+            expected = model(x, edge_index)
+            actual = quantized(x, edge_index)
+
+        assert torch.allclose(actual, expected, atol=5e-2)
+
+    @pytest.mark.skipif(not CHECKPOINT_PATH.exists(), reason="нет обученного чекпойнта data/graph-save/gnn_model.pth")
+    def test_quantized_regressor_matches_fp32_on_checkpoint(self):
+        """На обученных весах и реальном графе int8-голова отличается от FP32 не более чем на 0.5 п.п."""
+        checkpoint = torch.load(CHECKPOINT_PATH, map_location="cpu")
+        config = checkpoint["config"]
+        fp32 = GraphSAGEChurn(
+            in_channels=config["in_channels"],
+            hidden_channels=config["hidden_channels"],
+            num_layers=config["num_layers"],
+            dropout=config["dropout"],
+        )
+        fp32.load_state_dict(checkpoint["model_state_dict"])
+        fp32.eval()
+        quantized = quantize_regressor(copy.deepcopy(fp32))
+
+        edge_index = torch.load(EDGE_INDEX_PATH, map_location="cpu").long()
+        num_nodes = int(edge_index.max()) + 1
+        # Признаки в модель идут после StandardScaler: стандартизованные значения
+        x = torch.randn(num_nodes, config["in_channels"], generator=torch.Generator().manual_seed(0))
+
+        with torch.no_grad():
+            expected = fp32(x, edge_index)
+            actual = quantized(x, edge_index)
+
+        assert (actual - expected).abs().max().item() <= 5e-3
+
+
+class TestFoldedScaler:
+    """Модель со встроенным StandardScaler на сырых признаках = исходная модель на масштабированных"""
+
+    def test_folded_scaler_matches_scaled_input(self, graph, model):
+        x_base, edge_index_base = graph
+        gen = torch.Generator().manual_seed(1)
+        mean = torch.randn(IN_CHANNELS, generator=gen)
+        scale = torch.rand(IN_CHANNELS, generator=gen) + 0.5
+
+        x_raw = x_base * scale + mean
+        x_new_raw = torch.randn(1, IN_CHANNELS) * scale + mean
+        existing_node_idx = 5
+
+        expected = full_graph_predict(
+            model, (x_raw - mean) / scale, edge_index_base, existing_node_idx, (x_new_raw - mean) / scale
+        )
+
+        folded = fold_input_scaler(copy.deepcopy(model), mean.numpy(), scale.numpy())
+        x_sub, edge_index_sub, new_local_idx = build_new_node_subgraph(
+            x_raw, edge_index_base, existing_node_idx, x_new_raw, num_hops=len(folded.convs)
+        )
+        with torch.no_grad():
+            actual = folded(x_sub, edge_index_sub)[new_local_idx]
+
+        assert torch.allclose(actual, expected, atol=1e-4)
+
+
+class TestCompiledForward:
+    """Под torch.compile модель получает edge_index: dynamo должен построить граф, а не пропустить forward"""
+
+    @pytest.mark.parametrize("quantize", [False, True])
+    def test_compiled_edge_index_forward(self, graph, model, quantize):
+        x, edge_index = graph
+        m = quantize_regressor(copy.deepcopy(model)) if quantize else model
+
+        torch._dynamo.reset()
+        with torch.no_grad():
+            expected = m(x, edge_index)
+            explanation = torch._dynamo.explain(m)(x, edge_index)
+            actual = torch.compile(m, backend="eager", dynamic=True)(x, edge_index)
+
+        assert explanation.graph_count >= 1
+        assert torch.allclose(actual, expected, atol=1e-5)
@@ -0,0 +1,43 @@
+# Запуск: pytest tests/test_data_preprocessing.py
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pytest.importorskip("numba")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "func_blocks_analysis" / "src"))
+
+from data_preprocessing import _collapse_kernel, _collapse_vectorized
+
+
+def make_groups(seed, num_rows=5000, dtype=np.float64):
+    rng = np.random.default_rng(seed)
+    # Группы экрана - непрерывные отрезки разной длины, в том числе из одних "Не указано"
+    group_id = np.cumsum(rng.random(num_rows) < 0.3).astype(np.int64)
+    is_ns = rng.random(num_rows) < 0.5
+    is_ns[group_id % 11 == 0] = True
+    duration = rng.integers(0, 600, num_rows).astype(dtype)
+    return group_id, is_ns, duration
+
+
+class TestCollapseKernel:
+    """JIT-ядро схлопывания "Не указано" и векторный вариант без numba дают одинаковый результат"""
+
+    @pytest.mark.parametrize("seed", [0, 1, 2])
+    @pytest.mark.parametrize("dtype", [np.float64, np.int64])
+    def test_kernel_matches_vectorized(self, seed, dtype):
+        group_id, is_ns, duration = make_groups(seed, dtype=dtype)
+
+        kernel_duration, kernel_keep = duration.copy(), np.empty(len(duration), dtype=bool)
+        _collapse_kernel(group_id, is_ns, kernel_duration, kernel_keep)
+
+        vectorized_duration, vectorized_keep = duration.copy(), np.empty(len(duration), dtype=bool)
+        _collapse_vectorized(group_id, is_ns, vectorized_duration, vectorized_keep)
+
+        np.testing.assert_array_equal(kernel_keep, vectorized_keep)
+        np.testing.assert_allclose(kernel_duration, vectorized_duration)
+        # Суммарная длительность сохранённых записей не меняется при схлопывании групп со значимыми записями
+        assert kernel_duration[kernel_keep].sum() == pytest.approx(duration.sum())